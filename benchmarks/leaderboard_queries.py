@@ -0,0 +1,68 @@
+"""Time leaderboard queries and updates against a full sort per view.
+
+Run from the repository root:
+    python benchmarks/leaderboard_queries.py --players 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mud_game import BlackCloverMUD, Player, PlayerRegistry
+
+SWORDS = ['Demon Slayer', 'Demon Dweller', 'Demon Destroyer', 'Demon-Majestic']
+
+
+def make_players(count):
+    magic_types = BlackCloverMUD.valid_magic_types
+    players = []
+    for i in range(count):
+        player = Player(f"Mage{i}", magic_types[i % len(magic_types)], "pw")
+        player.level = random.randint(1, 60)
+        player.sword_awards = SWORDS[:random.randint(0, 4)]
+        players.append(player)
+    return players
+
+
+def per_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=1000)
+    args = parser.parse_args()
+
+    players = make_players(args.players)
+    registry = PlayerRegistry(players)
+    leaderboard = registry.leaderboard
+    names = [registry.key(random.choice(players).name) for _ in range(args.repeat)]
+
+    def level_up_random():
+        player = random.choice(players)
+        player.level += 1
+        registry.reindex(player)
+
+    full_sort = per_call(lambda: sorted(players, key=lambda x: (len(x.sword_awards), x.level), reverse=True)[:10], 3)
+    top10 = per_call(lambda: leaderboard.top(10), args.repeat)
+    deep_page = per_call(lambda: leaderboard.page(args.players // 100, 10), args.repeat)
+    rank = per_call(lambda: leaderboard.rank_of(random.choice(names)), args.repeat)
+    update = per_call(level_up_random, args.repeat)
+
+    print(f"{args.players} players")
+    print(f"  full sort (old)   : {full_sort * 1e3:10.3f} ms")
+    print(f"  top 10            : {top10 * 1e3:10.3f} ms")
+    print(f"  page at 1%        : {deep_page * 1e3:10.3f} ms")
+    print(f"  my rank           : {rank * 1e3:10.3f} ms")
+    print(f"  level_up + update : {update * 1e3:10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Measure logins/sec and event-loop stalls with concurrent logins.
+
+Every simulated client logs in repeatedly through BlackCloverMUD.login_player,
+awaiting the hasher's future like a server session does. With 0 workers the
+hash is checked inline on the event loop, as the console does; the
+"max stall" column shows how long other sessions would have been frozen.
+
+Run from the repository root:
+    python benchmarks/login_throughput.py --clients 64 --workers 0 1 2 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mud_auth import PasswordHasher, add_cost_arguments, cost_from_args
+from mud_game import BlackCloverMUD, Player, PlayerRegistry, current_output
+
+
+async def drive(flow):
+    """Run a game flow to its result, awaiting any futures it yields."""
+    try:
+        prompt = next(flow)
+        while True:
+            prompt = flow.send(await prompt)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def watch_loop(interval, stalls, done):
+    # How late the loop wakes this task up is how long it was blocked.
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - start - interval)
+
+
+async def run(game, clients, logins):
+    latencies = []
+    stalls = []
+    done = asyncio.Event()
+
+    async def client(i):
+        for _ in range(logins):
+            start = time.perf_counter()
+            player = await drive(game.login_player(f"Mage{i}", "pw"))
+            assert player is not None
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+
+    watcher = asyncio.create_task(watch_loop(0.005, stalls, done))
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await watcher
+    return elapsed, sorted(latencies), max(stalls, default=0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--logins', type=int, default=4, help="Logins per client.")
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4])
+    add_cost_arguments(parser)
+    args = parser.parse_args()
+    cost = cost_from_args(args)
+
+    stored = PasswordHasher(cost).hash("pw")
+    players = [Player(f"Mage{i}", "Fire", stored) for i in range(args.clients)]
+    current_output.set(lambda text: None)
+
+    total = args.clients * args.logins
+    print(f"{args.clients} clients x {args.logins} logins, scrypt n=2**{cost['log_n']} r={cost['r']} p={cost['p']}")
+    print(f"{'workers':>7} {'logins/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max stall ms':>13}")
+    for workers in args.workers:
+        hasher = PasswordHasher(cost, workers)
+        game = BlackCloverMUD(hasher=hasher)
+        game.players = PlayerRegistry(players)
+        try:
+            elapsed, latencies, stall = asyncio.run(run(game, args.clients, args.logins))
+        finally:
+            hasher.close()
+        print(f"{workers:>7} {total / elapsed:>9.1f} {latencies[len(latencies) // 2] * 1e3:>8.1f} "
+              f"{latencies[int(0.99 * (len(latencies) - 1))] * 1e3:>8.1f} {stall * 1e3:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Count transport writes and bytes for scripted battles, per line vs buffered.
+
+Per line is how sessions used to send output: one write for every say() and
+one for every prompt. Buffered collects a whole screen in a ScreenBuffer and
+writes it together with the prompt.
+
+Run from the repository root:
+    python benchmarks/output_writes.py --battles 1000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mud_game import BlackCloverMUD, Player, ScreenBuffer, current_output
+
+
+class Counter:
+    def __init__(self):
+        self.writes = 0
+        self.bytes_written = 0
+
+    def __call__(self, text):
+        self.writes += 1
+        self.bytes_written += len(text.replace('\n', '\r\n').encode('utf-8'))
+
+
+def play_battles(game, battles, seed, output, prompt_out):
+    """Run scripted battles with output going to `output`; returns turns taken."""
+    random.seed(seed)
+    token = current_output.set(output)
+    turns = 0
+    try:
+        for i in range(battles):
+            player = Player(f"Mage{i}", BlackCloverMUD.valid_magic_types[i % 5], "pw")
+            player.kingdom = "Clover"
+            flow = game.battle(player)
+            try:
+                prompt = next(flow)
+                while True:
+                    prompt_out(prompt)
+                    turns += 1
+                    reply = 'restart' if 'restart' in prompt else random.choice('1123')
+                    prompt = flow.send(reply)
+            except StopIteration:
+                pass
+    finally:
+        current_output.reset(token)
+    return turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--battles', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-color', action='store_true')
+    args = parser.parse_args()
+    game = BlackCloverMUD()
+
+    per_line = Counter()
+    start = time.perf_counter()
+    turns = play_battles(game, args.battles, args.seed, per_line, per_line)
+    per_line_time = time.perf_counter() - start
+
+    sink = Counter()
+    screen = ScreenBuffer(sink, color=not args.no_color)
+    start = time.perf_counter()
+    play_battles(game, args.battles, args.seed, screen, screen.flush)
+    buffered_time = time.perf_counter() - start
+
+    print(f"{args.battles} battles, {turns} prompts")
+    print(f"{'':<10} {'writes':>10} {'writes/turn':>12} {'bytes/turn':>11} {'time':>8}")
+    for label, counter, elapsed in (('per line', per_line, per_line_time),
+                                    ('buffered', sink, buffered_time)):
+        print(f"{label:<10} {counter.writes:>10} {counter.writes / turns:>12.1f} "
+              f"{counter.bytes_written / turns:>11.0f} {elapsed:>7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
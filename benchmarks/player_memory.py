@@ -0,0 +1,77 @@
+"""Measure memory per loaded player: the slotted Player vs a plain attribute object.
+
+Run from the repository root:
+    python benchmarks/player_memory.py --players 1000000
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mud_game import Player
+
+KINGDOM_SWORDS = [('Clover', 'Demon Slayer'), ('Diamond', 'Demon Dweller'),
+                  ('Heart', 'Demon Destroyer'), ('Spade', 'Demon-Majestic')]
+MAGIC_TYPES = ["Fire", "Water", "Wind", "Earth", "Lightning"]
+
+
+class DictPlayer:
+    """The pre-slots Player layout: one __dict__ and one string per field value."""
+
+    @classmethod
+    def from_dict(cls, data):
+        player = cls()
+        player.__dict__.update(data)
+        player.dirty = False
+        return player
+
+
+def make_records(count):
+    # Encoded and decoded like players_data.json, so every string is its own
+    # object, as it would be after json.load.
+    records = []
+    for i in range(count):
+        won = KINGDOM_SWORDS[:i % 5]
+        records.append(json.dumps({
+            'name': f"Mage{i}", 'magic_type': MAGIC_TYPES[i % 5], 'password': "pw",
+            'level': 1 + i % 40, 'experience': 0, 'spells': [],
+            'kingdoms_won': [kingdom for kingdom, _ in won],
+            'sword_awards': [sword for _, sword in won],
+            'kingdom': won[-1][0] if won else "", 'magic': 10,
+            'hp': 100, 'max_hp': 100, 'mana': 50, 'max_mana': 50,
+            'inventory': {"Health Potion": 2, "Mana Potion": 1}}))
+    return records
+
+
+def bytes_per_player(factory, records):
+    gc.collect()
+    tracemalloc.start()
+    players = [factory(json.loads(record)) for record in records]
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del players
+    return size / len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    records = make_records(args.players)
+    plain = bytes_per_player(DictPlayer.from_dict, records)
+    slotted = bytes_per_player(Player.from_dict, records)
+
+    print(f"{args.players} players")
+    print(f"  plain objects : {plain:8.0f} bytes/player")
+    print(f"  Player        : {slotted:8.0f} bytes/player")
+    print(f"  saved         : {1 - slotted / plain:8.0%}")
+
+
+if __name__ == "__main__":
+    main()
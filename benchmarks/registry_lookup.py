@@ -0,0 +1,61 @@
+"""Compare login lookups on a plain player list against PlayerRegistry.
+
+Run from the repository root:
+    python benchmarks/registry_lookup.py --players 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mud_game import BlackCloverMUD, Player, PlayerRegistry, current_output
+
+
+def make_players(count):
+    magic_types = BlackCloverMUD.valid_magic_types
+    return [Player(f"Mage{i}", magic_types[i % len(magic_types)], "pw") for i in range(count)]
+
+
+def linear_login(players, name):
+    # The lookup login_player used before the registry existed.
+    for player in players:
+        if player.name.lower() == name.lower():
+            return player
+    return None
+
+
+def time_logins(lookup, names):
+    start = time.perf_counter()
+    for name in names:
+        lookup(name)
+    return (time.perf_counter() - start) / len(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=100_000)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    players = make_players(args.players)
+    names = [f"MAGE{random.randrange(args.players)}" for _ in range(args.lookups)]
+
+    game = BlackCloverMUD()
+    game.players = PlayerRegistry(players)
+    current_output.set(lambda text: None)
+
+    linear = time_logins(lambda name: linear_login(players, name), names)
+    # Only the lookup: checking the password hash costs the same either way.
+    indexed = time_logins(game.players.get, names)
+
+    print(f"{args.players} players, {args.lookups} logins")
+    print(f"  list scan : {linear * 1e6:10.1f} us/login")
+    print(f"  registry  : {indexed * 1e6:10.1f} us/login")
+    print(f"  speedup   : {linear / indexed:10.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Measure quests/sec through a sharded server as the shard count grows.
+
+For each shard count a fresh mud_shard.py server is started in a temporary
+folder. Client processes open --clients telnet connections in total; each
+creates a player and then embarks on quests as fast as the server answers.
+Throughput should grow with shards until the cores (or the clients) run out.
+
+Run from the repository root:
+    python benchmarks/shard_throughput.py --shards 1 2 4 --clients 256
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPT = b"Enter your choice: "
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def client(port, name, deadline, counts):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+    async def send(*lines):
+        writer.write(''.join(line + '\n' for line in lines).encode())
+        await reader.readuntil(PROMPT)
+
+    await reader.readuntil(b": ")
+    writer.write(f"{name}\n".encode())
+    await reader.readuntil(PROMPT)
+    await send('1', name, 'Fire', 'pw')
+    while time.perf_counter() < deadline:
+        await send('9', 'yes')
+        counts[0] += 1
+    writer.close()
+
+
+def run_clients(port, first, count, seconds, results):
+    async def run():
+        counts = [0]
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(client(port, f"Mage{i}", deadline, counts) for i in range(first, first + count)))
+        return counts[0]
+    results.put(asyncio.run(run()))
+
+
+def measure(shards, clients, client_procs, seconds):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as folder:
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'mud_shard.py'), '--host', '127.0.0.1', '--port', str(port),
+             '--shards', str(shards), '--content', os.path.join(ROOT, 'content.json'), '--no-color',
+             '--hash-log-n', '4', '--hash-r', '1', '--tick-rate', '100', '--autosave', '0'],
+            cwd=folder, stdout=subprocess.PIPE, text=True, env=dict(os.environ, PYTHONUNBUFFERED='1'))
+        try:
+            # One line from the front, then one per shard once it has loaded
+            for _ in range(shards + 1):
+                server.stdout.readline()
+            results = multiprocessing.Queue()
+            per_proc = clients // client_procs
+            procs = [multiprocessing.Process(target=run_clients,
+                                             args=(port, i * per_proc, per_proc, seconds, results))
+                     for i in range(client_procs)]
+            start = time.perf_counter()
+            for proc in procs:
+                proc.start()
+            quests = sum(results.get() for _ in procs)
+            elapsed = time.perf_counter() - start
+            for proc in procs:
+                proc.join()
+        finally:
+            server.terminate()
+            server.wait()
+    return quests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=256, help="Connections in total.")
+    parser.add_argument('--client-procs', type=int, default=2, help="Processes driving the clients.")
+    parser.add_argument('--seconds', type=float, default=10.0)
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients, {args.seconds:g}s per run, {os.cpu_count()} cores")
+    print(f"{'shards':>6} {'quests/s':>9}")
+    for shards in args.shards:
+        print(f"{shards:>6} {measure(shards, args.clients, args.client_procs, args.seconds):>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""Benchmark saving, loading, login, leaderboard and battle on synthetic rosters.
+
+Every benchmark builds a roster of the given size, runs its operation a few
+times to warm up and then times each repeat separately, reporting p50/p99
+per operation plus peak traced memory: for building the fixture (roster,
+store) and for a single operation. Results can be written as JSON and
+compared with a stored baseline; any p50 slower than the baseline by more
+than --threshold fails the run (exit status 1).
+
+Run from the repository root:
+    python benchmarks/suite.py --sizes 1000 10000 100000 --output baseline.json
+    python benchmarks/suite.py --sizes 1000 10000 100000 --baseline baseline.json
+    python benchmarks/suite.py --sizes 1000000 --only login leaderboard battle
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mud_auth import PasswordHasher
+from mud_battle import default_content
+from mud_game import BlackCloverMUD, Player, PlayerRegistry, current_output
+from mud_storage import JsonStore, MemoryStore, SQLiteStore
+
+# Cheapest scrypt cost: login measures the game's own work, not the hash
+# (see login_throughput.py for that).
+FAST_HASH = {'log_n': 1, 'r': 1, 'p': 1}
+BENCHMARKS = {}
+
+
+def benchmark(name, heavy=False):
+    """Register setup(size, rng, folder) -> operation. Heavy ones get fewer repeats."""
+    def register(setup):
+        BENCHMARKS[name] = (setup, heavy)
+        return setup
+    return register
+
+
+# ------------------ Synthetic Rosters ------------------ #
+def make_roster(size, rng):
+    magic_types = BlackCloverMUD.valid_magic_types
+    content = default_content()
+    kingdoms = content.kingdoms
+    players = []
+    for i in range(size):
+        player = Player(f"Mage{i}", magic_types[i % len(magic_types)], "pw")
+        player.level = rng.randint(1, 60)
+        player.experience = rng.randrange(0, 5000)
+        for kingdom in kingdoms[:rng.randint(0, len(kingdoms))]:
+            player.win_kingdom(kingdom, content.swords[kingdom])
+        player.kingdom = rng.choice(kingdoms)
+        player.dirty = False
+        players.append(player)
+    return players
+
+
+def make_game(players, store=None):
+    game = BlackCloverMUD(store=store or MemoryStore(), hasher=PasswordHasher(FAST_HASH))
+    game.players = PlayerRegistry(players)
+    return game
+
+
+def drive(flow, replies):
+    """Run a game flow inline, answering prompts from `replies`."""
+    try:
+        prompt = next(flow)
+        while True:
+            prompt = flow.send(replies(prompt))
+    except StopIteration as stop:
+        return stop.value
+
+
+def load(game, size):
+    game.load_players_data()
+    # load_players_data reports errors instead of raising them
+    assert len(game.players) == size
+
+
+# ------------------ Benchmarks ------------------ #
+@benchmark('save_json', heavy=True)
+def setup_save_json(size, rng, folder):
+    players = make_roster(size, rng)
+    game = make_game(players, JsonStore(folder))
+    game.store.journal.compact(game.players)
+
+    def save():
+        # About 1% of players changed since the last save
+        for player in rng.sample(players, max(1, size // 100)):
+            player.mark_dirty()
+        game.save_players_data()
+    return save
+
+
+@benchmark('save_sqlite', heavy=True)
+def setup_save_sqlite(size, rng, folder):
+    players = make_roster(size, rng)
+    game = make_game(players, SQLiteStore(os.path.join(folder, 'players.db')))
+    game.store.save_players(players, game.players)
+
+    def save():
+        for player in rng.sample(players, max(1, size // 100)):
+            player.mark_dirty()
+        game.save_players_data()
+    return save
+
+
+@benchmark('load_json', heavy=True)
+def setup_load_json(size, rng, folder):
+    store = JsonStore(folder)
+    game = make_game(make_roster(size, rng), store)
+    store.journal.compact(game.players)
+    return lambda: load(game, size)
+
+
+@benchmark('load_sqlite', heavy=True)
+def setup_load_sqlite(size, rng, folder):
+    store = SQLiteStore(os.path.join(folder, 'players.db'))
+    game = make_game(make_roster(size, rng), store)
+    store.save_players(list(game.players), game.players)
+    return lambda: load(game, size)
+
+
+@benchmark('load_snapshot', heavy=True)
+def setup_load_snapshot(size, rng, folder):
+    store = JsonStore(folder)
+    game = make_game(make_roster(size, rng), store)
+    store.journal.compact(game.players)
+    game.write_snapshot()
+
+    def load_and_query():
+        # Opening alone decodes nothing; include the first lookups a session makes
+        load(game, size)
+        game.players.get(f"Mage{rng.randrange(size)}")
+        game.players.leaderboard_page(0, 10)
+    return load_and_query
+
+
+@benchmark('login')
+def setup_login(size, rng, folder):
+    players = make_roster(size, rng)
+    stored = PasswordHasher(FAST_HASH).hash("pw")
+    for player in players:
+        player.password = stored
+    game = make_game(players)
+
+    def login():
+        name = f"MAGE{rng.randrange(size)}"
+        assert drive(game.login_player(name, "pw"), None) is not None
+    return login
+
+
+@benchmark('leaderboard')
+def setup_leaderboard(size, rng, folder):
+    players = make_roster(size, rng)
+    game = make_game(players)
+
+    def leaderboard():
+        game.display_leaderboard(limit=10, viewer=rng.choice(players))
+    return leaderboard
+
+
+@benchmark('battle')
+def setup_battle(size, rng, folder):
+    players = make_roster(size, rng)
+    game = make_game(players)
+
+    def reply(prompt):
+        return 'restart' if 'restart' in prompt else rng.choice('1123')
+
+    def battle():
+        # One full three-level battle; wins reindex the player on the leaderboard.
+        player = rng.choice(players)
+        drive(game.battle(player, rng), reply)
+    return battle
+
+
+# ------------------ Harness ------------------ #
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_benchmark(name, size, warmup, repeats, seed):
+    setup, heavy = BENCHMARKS[name]
+    if heavy:
+        warmup, repeats = min(warmup, 1), max(3, repeats // 10)
+    rng = random.Random(f"{seed}:{name}:{size}")
+    folder = tempfile.mkdtemp(prefix='mud-bench-')
+    try:
+        gc.collect()
+        tracemalloc.start()
+        operation = setup(size, rng, folder)
+        _, setup_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        for _ in range(warmup):
+            operation()
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            operation()
+            timings.append(time.perf_counter() - start)
+
+        # Traced separately: tracemalloc slows the operation down.
+        gc.collect()
+        tracemalloc.start()
+        operation()
+        _, op_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    timings.sort()
+    return {'benchmark': name, 'size': size, 'repeats': repeats,
+            'p50_ms': percentile(timings, 0.50) * 1e3, 'p99_ms': percentile(timings, 0.99) * 1e3,
+            'mean_ms': sum(timings) / len(timings) * 1e3,
+            'setup_peak_mib': setup_peak / 2 ** 20, 'op_peak_kib': op_peak / 2 ** 10}
+
+
+def compare(results, baseline, threshold):
+    """Print each result against the baseline; returns the regressions."""
+    previous = {(result['benchmark'], result['size']): result for result in baseline['results']}
+    regressions = []
+    print(f"\n{'benchmark':<13} {'size':>8} {'p50 ms':>10} {'baseline':>10} {'change':>8}")
+    for result in results:
+        before = previous.get((result['benchmark'], result['size']))
+        if before is None:
+            continue
+        change = result['p50_ms'] / before['p50_ms'] - 1 if before['p50_ms'] else 0.0
+        failed = change > threshold
+        if failed:
+            regressions.append(result)
+        print(f"{result['benchmark']:<13} {result['size']:>8} {result['p50_ms']:>10.3f} "
+              f"{before['p50_ms']:>10.3f} {change:>+8.0%}{'  REGRESSION' if failed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10_000, 100_000])
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--repeats', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write results to this JSON file.")
+    parser.add_argument('--baseline', help="Compare p50 timings with this results file.")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Fail when a p50 is this much slower than the baseline (0.25 = 25%%).")
+    args = parser.parse_args()
+
+    current_output.set(lambda text: None)
+    results = []
+    print(f"{'benchmark':<13} {'size':>8} {'p50 ms':>10} {'p99 ms':>10} {'setup MiB':>10} {'op KiB':>9}")
+    for size in args.sizes:
+        for name in args.only:
+            result = run_benchmark(name, size, args.warmup, args.repeats, args.seed)
+            results.append(result)
+            print(f"{name:<13} {size:>8} {result['p50_ms']:>10.3f} {result['p99_ms']:>10.3f} "
+                  f"{result['setup_peak_mib']:>10.1f} {result['op_peak_kib']:>9.1f}", flush=True)
+
+    report = {'python': platform.python_version(), 'platform': platform.platform(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
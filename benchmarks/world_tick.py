@@ -0,0 +1,75 @@
+"""Time world ticks with many concurrent battles, each acting every tick.
+
+Exits with status 1 if any tick ran over its budget, so it can gate a build.
+Run from the repository root:
+    python benchmarks/world_tick.py --battles 10000 --tick-rate 10
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mud_battle import Fight
+from mud_game import BlackCloverMUD, Player
+from mud_world import World
+
+ACTIONS = ['attack', 'spell', 'spell', 'defend']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--battles', type=int, default=10_000)
+    parser.add_argument('--tick-rate', type=int, default=10)
+    parser.add_argument('--ticks', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    magic_types = BlackCloverMUD.valid_magic_types
+    world = World(args.tick_rate)
+    fights = []
+
+    def new_fight(i, player=None):
+        if player is None:
+            player = Player(f"Mage{i}", magic_types[i % len(magic_types)], "pw")
+        return Fight(player, rng.randrange(3), rng)
+
+    answered = []
+
+    def queue(i):
+        # Like a session: the next action is only sent once the last one is
+        # answered, outside the tick.
+        fight = fights[i]
+        if fight.outcome is not None:
+            # The same player fights on, as in a session
+            fight = fights[i] = new_fight(i, fight.player)
+        world.submit_turn(fight, rng.choice(ACTIONS), None, lambda events: answered.append(i))
+
+    for i in range(args.battles):
+        fights.append(new_fight(i))
+        queue(i)
+    gc.freeze()     # As MUDServer.serve does with the roster it loaded
+    for _ in range(args.ticks):
+        world.tick()
+        for i in answered:
+            queue(i)
+        answered.clear()
+
+    summary = world.metrics.summary()
+    print(f"{args.battles} concurrent battles, {summary['ticks']} ticks, "
+          f"{summary['actions'] / summary['ticks']:.0f} actions/tick")
+    print(f"  budget : {summary['budget_ms']:8.2f} ms")
+    print(f"  p50    : {summary['p50_ms']:8.2f} ms")
+    print(f"  p99    : {summary['p99_ms']:8.2f} ms")
+    print(f"  max    : {summary['max_ms']:8.2f} ms")
+    print(f"  over budget: {summary['overruns']} ticks")
+    print(f"  carried    : {summary['carried'] / summary['ticks']:.0f} actions/tick to the next tick")
+    if summary['overruns']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
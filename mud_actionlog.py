@@ -0,0 +1,179 @@
+"""Compact binary log of one play session, for replaying it later.
+
+A session's random rolls all come from one random.Random(seed), so the seed
+plus everything the player typed is enough to play it again exactly. The
+log holds:
+
+    header   b'MUDLOG', format version (1 byte), seed (8 bytes, big-endian)
+    records  kind (1 byte), payload length (varint), payload
+
+INPUT records are the replies sent to the session's flow, in order. Replies
+to password prompts (yielded as Secret) are logged as SECRET without the
+text. LOGIN and LOAD record the player a session took over, as it was at
+that moment (Player.to_dict() JSON without the password), since the rest of
+the roster is not in the log. DENIED (version 2) records a login refused
+for a wrong password, which the replay cannot check without the password.
+CHECK records the player's state after every battle and quest; mud_replay
+compares them to find where a replay diverges.
+"""
+import contextvars
+import json
+import os
+import time
+
+MAGIC = b'MUDLOG'
+VERSION = 2
+READABLE_VERSIONS = (1, 2)     # Version 1 logs have no DENIED records
+
+INPUT, SECRET, LOGIN, LOAD, CHECK, DENIED = 1, 2, 3, 4, 5, 6
+PLAYER_RECORDS = (LOGIN, LOAD, CHECK)
+
+# The ActionLog of the session running in this context, if it is recorded.
+current_log = contextvars.ContextVar('current_log', default=None)
+
+
+class Secret(str):
+    """A prompt whose reply must not be written to the log."""
+
+
+class LogFormatError(ValueError):
+    pass
+
+
+def new_seed():
+    return int.from_bytes(os.urandom(8), 'big')
+
+
+def player_state(player):
+    """Player.to_dict() without the password, sharing nothing with the live player.
+
+    to_dict() hands out the player's own inventory and spells; a replay keeps
+    the states it checks, so later play must not change them.
+    """
+    state = player.to_dict()
+    state.pop('password', None)
+    state['inventory'] = dict(state['inventory'])
+    state['spells'] = list(state['spells'])
+    return state
+
+
+def _varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+# ------------------ Writing ------------------ #
+class ActionLog:
+    def __init__(self, file, seed):
+        self.file = file
+        self.seed = seed
+        file.write(MAGIC + bytes([VERSION]) + seed.to_bytes(8, 'big'))
+
+    @classmethod
+    def create(cls, folder, seed):
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{time.strftime('%Y%m%d-%H%M%S')}-{seed:016x}.mudlog")
+        return cls(open(path, 'wb'), seed)
+
+    def write(self, kind, payload=b''):
+        self.file.write(bytes([kind]) + _varint(len(payload)) + payload)
+
+    def input(self, reply, secret=False):
+        if secret:
+            self.write(SECRET)
+        else:
+            self.write(INPUT, reply.encode('utf-8'))
+
+    def player(self, kind, player):
+        self.write(kind, json.dumps(player_state(player), separators=(',', ':')).encode('utf-8'))
+
+    def denied(self):
+        self.write(DENIED)
+
+    def close(self):
+        self.file.close()
+
+
+def note_player(kind, player):
+    """Record a LOGIN, LOAD or CHECK for the current session, if it is logged."""
+    log = current_log.get()
+    if log is not None:
+        log.player(kind, player)
+
+
+def note_denied():
+    """Record a refused login for the current session, if it is logged."""
+    log = current_log.get()
+    if log is not None:
+        log.denied()
+
+
+def recorded(flow, log):
+    """Pass `flow` through unchanged, logging every reply the player sends it.
+
+    Futures a flow yields (battle turns on the world tick, password hashing)
+    are answered by the server rather than the player, and are recomputed on
+    replay, so their results are not logged.
+    """
+    token = current_log.set(log)
+    try:
+        prompt = next(flow)
+        while True:
+            reply = yield prompt
+            if isinstance(prompt, str):
+                log.input(reply, isinstance(prompt, Secret))
+            prompt = flow.send(reply)
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        flow.close()
+        current_log.reset(token)
+
+
+# ------------------ Reading ------------------ #
+def read_log(data):
+    """(seed, [(kind, value), ...]) from a log's bytes.
+
+    value is the reply text for INPUT, None for SECRET and DENIED, the player state
+    dict for LOGIN, LOAD and CHECK. A log cut short (the server stopped
+    mid-write) yields the records before the cut.
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise LogFormatError("not an action log")
+    position = len(MAGIC)
+    if data[position] not in READABLE_VERSIONS:
+        raise LogFormatError(f"unsupported action log version {data[position]}")
+    seed = int.from_bytes(data[position + 1:position + 9], 'big')
+    position += 9
+    records = []
+    end = len(data)
+    while position < end:
+        kind = data[position]
+        position += 1
+        length = shift = 0
+        while position < end:
+            byte = data[position]
+            position += 1
+            length |= (byte & 0x7f) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        else:
+            break
+        if position + length > end:
+            break
+        payload = data[position:position + length]
+        position += length
+        if kind == INPUT:
+            records.append((INPUT, payload.decode('utf-8')))
+        elif kind in (SECRET, DENIED):
+            records.append((kind, None))
+        elif kind in PLAYER_RECORDS:
+            records.append((kind, json.loads(payload)))
+        else:
+            raise LogFormatError(f"unknown record kind {kind}")
+    return seed, records
@@ -0,0 +1,101 @@
+"""Salted password hashes, checked off the server's event loop.
+
+Passwords are stored as 'scrypt$<log2 n>$<r>$<p>$<salt>$<hash>' (salt and
+hash base64). Records saved before hashing hold the plaintext password; they
+still verify, and needs_rehash() reports them so the game can replace them
+with a hash on the next successful login. The same happens to hashes made
+with a different cost than the current one.
+
+scrypt is deliberately slow and memory hungry. hashlib releases the GIL
+while it runs, so a PasswordHasher with workers runs it on a bounded thread
+pool: a burst of logins queues on the pool instead of stalling every other
+session on the event loop. Without workers (the console) hashing runs inline.
+"""
+import asyncio
+import base64
+import concurrent.futures
+import hashlib
+import hmac
+import os
+
+SCHEME = 'scrypt'
+# n = 2 ** log_n; memory per hash is about 128 * r * n bytes (16 MiB here).
+DEFAULT_COST = {'log_n': 14, 'r': 8, 'p': 1}
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+
+def _scrypt(password, salt, log_n, r, p):
+    n = 1 << log_n
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                          maxmem=2 * 128 * r * (n + p), dklen=HASH_BYTES)
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def hash_password(password, cost=None):
+    cost = cost or DEFAULT_COST
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, cost['log_n'], cost['r'], cost['p'])
+    return f"{SCHEME}${cost['log_n']}${cost['r']}${cost['p']}${_b64(salt)}${_b64(digest)}"
+
+
+def parse_hash(stored):
+    """(cost, salt, digest) for a stored hash, or None for a plaintext record."""
+    parts = stored.split('$')
+    if len(parts) != 6 or parts[0] != SCHEME:
+        return None
+    try:
+        cost = {'log_n': int(parts[1]), 'r': int(parts[2]), 'p': int(parts[3])}
+        return cost, base64.b64decode(parts[4], validate=True), base64.b64decode(parts[5], validate=True)
+    except ValueError:
+        return None
+
+
+def verify_password(password, stored):
+    parsed = parse_hash(stored)
+    if parsed is None:
+        # Plaintext record from before passwords were hashed
+        return hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+    cost, salt, digest = parsed
+    return hmac.compare_digest(_scrypt(password, salt, cost['log_n'], cost['r'], cost['p']), digest)
+
+
+class PasswordHasher:
+    """Hashes and checks passwords at one cost, inline or on a thread pool."""
+
+    def __init__(self, cost=None, workers=0):
+        self.cost = dict(cost or DEFAULT_COST)
+        self.pool = (concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hasher')
+                     if workers else None)
+
+    def hash(self, password):
+        return hash_password(password, self.cost)
+
+    def verify(self, password, stored):
+        return verify_password(password, stored)
+
+    def needs_rehash(self, stored):
+        parsed = parse_hash(stored)
+        return parsed is None or parsed[0] != self.cost
+
+    def submit(self, func, *args):
+        """Run func(*args) on the pool; an asyncio future for its result."""
+        return asyncio.get_running_loop().run_in_executor(self.pool, func, *args)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def add_cost_arguments(parser):
+    parser.add_argument('--hash-log-n', type=int, default=DEFAULT_COST['log_n'],
+                        help="scrypt CPU/memory cost as a power of two.")
+    parser.add_argument('--hash-r', type=int, default=DEFAULT_COST['r'], help="scrypt block size.")
+    parser.add_argument('--hash-p', type=int, default=DEFAULT_COST['p'], help="scrypt parallelism.")
+
+
+def cost_from_args(args):
+    return {'log_n': args.hash_log_n, 'r': args.hash_r, 'p': args.hash_p}
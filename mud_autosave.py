@@ -0,0 +1,132 @@
+"""Write-behind autosave for players changed during play.
+
+The game calls note(player) whenever a player levels up, wins a sword,
+gains quest experience, uses an item, ends a battle and so on. note()
+copies the player (a few microseconds, on the game's own thread) and queues
+the copy; a later change to the same player replaces the queued copy, so a
+burst of changes is written once. A dedicated I/O thread writes the queue through
+PlayerStore.save_changed when the oldest change is `interval` seconds old or
+`max_pending` players are waiting, so disk I/O stays out of battle turns.
+
+A player stays referenced until its copy is written: with on-demand loading
+(see LazyPlayerRegistry) an evicted player is therefore adopted again rather
+than reloaded from a store that does not have its changes yet.
+
+close() writes everything still queued and stops the thread.
+"""
+import threading
+import time
+
+from mud_metrics import METRICS
+
+AUTOSAVE_LABEL = (('what', 'autosave'),)
+
+
+class Autosaver:
+    def __init__(self, store, interval=30.0, max_pending=256):
+        self.store = store
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = {}           # name key -> (player, copy to write), oldest change first
+        self.since = None           # When the oldest pending change was noted
+        self.writing = False        # A batch taken from pending is being written
+        self.urgent = False         # flush() or close() is waiting on the queue
+        self.closing = False
+        self.failures = 0
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name='autosave', daemon=True)
+        self.thread.start()
+
+    def note(self, player):
+        """Queue the player's current state; call on the thread that changes players."""
+        copy = player.copy()
+        player.dirty = False
+        with self.condition:
+            if not self.pending:
+                self.since = time.monotonic()
+                self.condition.notify_all()
+            self.pending[player.name.casefold()] = (player, copy)
+            if len(self.pending) >= self.max_pending:
+                self.condition.notify_all()
+
+    def discard(self, name):
+        """Drop a player's queued state, waiting out a write in progress (for deletes)."""
+        with self.condition:
+            self.pending.pop(name.casefold(), None)
+            while self.writing:
+                self.condition.wait()
+
+    def flush(self):
+        """Write everything queued so far and wait until it is on disk.
+
+        If that write fails, the players are marked dirty again so the
+        caller's own save picks them up.
+        """
+        with self.condition:
+            self.urgent = True
+            self.condition.notify_all()
+            while self.pending or self.writing:
+                self.condition.wait()
+            self.urgent = False
+
+    def close(self):
+        """Write everything still queued (see flush) and stop the I/O thread."""
+        with self.condition:
+            self.closing = self.urgent = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def __len__(self):
+        return len(self.pending)
+
+    # -------- I/O Thread -------- #
+    def _due(self):
+        if self.urgent or len(self.pending) >= self.max_pending:
+            return 0
+        return self.since + self.interval - time.monotonic()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending or self._due() > 0:
+                    if self.closing and not self.pending:
+                        return
+                    self.condition.wait(self._due() if self.pending else None)
+                batch = self.pending
+                self.pending = {}
+                self.writing = True
+            try:
+                with METRICS.span('mud_save_seconds', AUTOSAVE_LABEL):
+                    self.store.save_changed([copy for _, copy in batch.values()])
+                METRICS.inc('mud_autosaved_players_total', amount=len(batch))
+                failed = False
+            except Exception as e:
+                print(f"Autosave of {len(batch)} player(s) failed: {e}")
+                METRICS.inc('mud_autosave_failures_total')
+                self.failures += 1
+                failed = True
+            with self.condition:
+                if failed and self.urgent:
+                    # Someone is waiting: hand the players back rather than
+                    # retry, so the waiter's own save writes them or reports.
+                    for player, _ in batch.values():
+                        if player.name.casefold() not in self.pending:
+                            player.dirty = True
+                elif failed:
+                    # Anything noted while writing is newer and wins
+                    batch.update(self.pending)
+                    self.pending = batch
+                    self.since = time.monotonic()
+                self.writing = False
+                self.condition.notify_all()
+
+
+def add_autosave_arguments(parser):
+    parser.add_argument('--autosave', type=float, default=30.0, metavar='SECONDS',
+                        help="Write changed players in the background at most this long after a change (0: off).")
+    parser.add_argument('--autosave-batch', type=int, default=256,
+                        help="Write sooner once this many changed players are waiting.")
+
+
+def autosaver_from_args(args, store):
+    return Autosaver(store, args.autosave, args.autosave_batch) if args.autosave > 0 else None
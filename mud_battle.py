@@ -0,0 +1,197 @@
+"""Battle and quest rules, separated from how they are presented.
+
+BlackCloverMUD.battle drives a Fight from the console or a network session and
+prints what happens; mud_simulation drives the same Fight from a policy object
+to measure balance. Nothing here reads input or prints, and every roll comes
+from the rng passed in, so a fight is reproducible from its seed.
+
+Enemy stats and the quest success chance can be overridden with a `tuning`
+dict (keys as in DEFAULT_TUNING) to try out balance changes in simulation.
+Spells, enemy names and item effects come from a mud_content.Content; without
+one, the content.json shipped with the game is used (see default_content).
+"""
+import functools
+
+from mud_content import load_content
+
+LEVELS = ['Ignite', 'Illuminate', 'Elite']
+
+ATTACK_DAMAGE = (5, 10)     # plus the player's level
+FLEE_CHANCE = 0.5
+
+ACTIONS = {'1': 'attack', '2': 'spell', '3': 'defend', '4': 'item', '5': 'flee'}
+
+DEFAULT_TUNING = {
+    'enemy_hp': 20,             # plus enemy_hp_per_level per battle level
+    'enemy_hp_per_level': 10,
+    'attack_min': 5,            # enemy attack range, plus 1 per battle level
+    'attack_max': 10,
+    'quest_success': 0.7,
+    'quest_experience': 50,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def default_content():
+    """The shipped content.json, read on first use rather than at import, so a
+    game given other content (--content) starts even if the shipped file is broken."""
+    return load_content()
+
+
+def make_enemy(level_index, rng, tuning=None, content=None):
+    tuning = tuning or DEFAULT_TUNING
+    return {"name": rng.choice((content or default_content()).enemies),
+            "hp": tuning['enemy_hp'] + level_index * tuning['enemy_hp_per_level'],
+            "attack_min": tuning['attack_min'] + level_index,
+            "attack_max": tuning['attack_max'] + level_index}
+
+
+def attempt_quest(player, rng, tuning=None):
+    """Roll a quest; on success the player gains experience. Returns success."""
+    tuning = tuning or DEFAULT_TUNING
+    if rng.random() < tuning['quest_success']:
+        player.experience += tuning['quest_experience']
+        return True
+    return False
+
+
+class Fight:
+    """One level of a battle: a player against a single enemy.
+
+    The player's HP and mana are restored when the fight starts. Each player
+    action counts as a turn. Unless that ended the fight, the enemy replies
+    with enemy_turn(), even when the action achieved nothing (not enough
+    mana, an item the player does not have). take_turn() does both halves;
+    mud_world splits them so enemy turns can be resolved in bulk. `outcome`
+    becomes 'won', 'lost' or 'fled' when the fight ends.
+    """
+
+    def __init__(self, player, level_index, rng, spell=None, tuning=None, content=None):
+        self.player = player
+        self.level_index = level_index
+        self.rng = rng
+        self.content = content or default_content()
+        self.spell = spell if spell is not None else self.content.spells.get(player.magic_type)
+        player.hp = player.max_hp
+        player.mana = player.max_mana
+        self.enemy = make_enemy(level_index, rng, tuning, self.content)
+        self.defended = False
+        self.turns = 0
+        self.out_of_mana = 0    # spell casts refused for lack of mana
+        self.outcome = None
+
+    @property
+    def level(self):
+        return LEVELS[self.level_index]
+
+    # -------- Player Actions -------- #
+    def attack(self):
+        self.turns += 1
+        damage = self.rng.randint(*ATTACK_DAMAGE) + self.player.level
+        self._hit_enemy(damage)
+        return damage
+
+    def cast_spell(self):
+        """Damage dealt, or None if the player cannot afford the spell."""
+        self.turns += 1
+        spell = self.spell
+        if self.player.mana < spell['cost']:
+            self.out_of_mana += 1
+            return None
+        self.player.mana -= spell['cost']
+        damage = self.rng.randint(*spell['damage_range'])
+        self._hit_enemy(damage)
+        return damage
+
+    def defend(self):
+        self.defended = True
+        self.turns += 1
+
+    def use_item(self, item):
+        """(attribute, amount) restored, () if the item has no effect, or None if not held."""
+        self.turns += 1
+        inventory = self.player.inventory
+        if inventory.get(item, 0) <= 0:
+            return None
+        inventory[item] -= 1
+        items = self.content.items
+        effect = items.get(item) or items.get(item.lower())
+        if effect is None:
+            return ()
+        attribute, amount = effect
+        limit = getattr(self.player, 'max_' + attribute)
+        setattr(self.player, attribute, min(getattr(self.player, attribute) + amount, limit))
+        return effect
+
+    def flee(self):
+        self.turns += 1
+        if self.rng.random() < FLEE_CHANCE:
+            self.outcome = 'fled'
+            return True
+        return False
+
+    def _hit_enemy(self, damage):
+        self.enemy["hp"] -= damage
+        if self.enemy["hp"] <= 0:
+            self.outcome = 'won'
+
+    # -------- Enemy Turn -------- #
+    def enemy_turn(self):
+        """Damage dealt to the player; halved if the player defended this turn."""
+        damage = self.rng.randint(self.enemy["attack_min"], self.enemy["attack_max"])
+        if self.defended:
+            damage = damage // 2
+            self.defended = False
+        self.player.hp -= damage
+        if self.player.hp <= 0:
+            self.outcome = 'lost'
+        return damage
+
+    def enemy_event(self):
+        defended = self.defended
+        return ('enemy_attack', self.enemy_turn(), defended)
+
+    # -------- Whole Turns -------- #
+    def player_turn(self, action, item=None):
+        """Apply one named action (see ACTIONS) and return its events.
+
+        Events are tuples naming what happened: ('attack', damage),
+        ('spell', damage), ('no_mana',), ('no_spell',), ('defend',),
+        ('item', item, effect) with use_item's result, ('empty_inventory',),
+        ('fled',) or ('flee_failed',).
+        """
+        if action == 'attack':
+            return [('attack', self.attack())]
+        if action == 'spell':
+            if self.spell is None:
+                self.turns += 1
+                return [('no_spell',)]
+            damage = self.cast_spell()
+            return [('no_mana',) if damage is None else ('spell', damage)]
+        if action == 'defend':
+            self.defend()
+            return [('defend',)]
+        if action == 'item':
+            if not self.player.inventory:
+                self.turns += 1
+                return [('empty_inventory',)]
+            return [('item', item, self.use_item(item))]
+        if action == 'flee':
+            return [('fled',) if self.flee() else ('flee_failed',)]
+        raise ValueError(f"Unknown action: {action}")
+
+    def take_turn(self, action, item=None):
+        """The player's action and, if the fight goes on, the enemy's reply."""
+        events = self.player_turn(action, item)
+        if self.outcome is None:
+            events.append(self.enemy_event())
+        return events
+
+
+def run_fight(player, level_index, policy, rng, tuning=None, max_turns=1000):
+    """Play one level headlessly; policy.choose(fight) returns (action, item)."""
+    fight = Fight(player, level_index, rng, tuning=tuning)
+    while fight.outcome is None and fight.turns < max_turns:
+        action, item = policy.choose(fight)
+        fight.take_turn(action, item)
+    return fight
@@ -0,0 +1,173 @@
+"""Encoding players for the JSON files in LoadData.
+
+A player is stored as a row: its fields as a JSON list in PLAYER_FIELDS
+order, so no field names are repeated per player and decoding is a single
+positional unpack. The roster snapshot (players_data.json) is still one JSON
+list, written and read a line at a time:
+
+    [{"schema":2,"fields":["name","magic_type",...]}
+    ,["Asta","Anti-Magic","scrypt$...",12,340,[],...]
+    ,...
+    ]
+
+The header names the fields the rows were written with; rows written with
+another field order or with fields missing are rearranged and given
+defaults on reading. A players_data.json from before schema 2 (a list of
+Player.to_dict() dicts, in any formatting) is still read, streamed one
+record at a time.
+
+JSON is encoded compactly with orjson when it is installed and the standard
+json module otherwise. MUD_JSON=json in the environment forces the standard
+module.
+"""
+import codecs
+import functools
+import json
+import os
+
+SCHEMA_VERSION = 2
+PLAYER_FIELDS = ('name', 'magic_type', 'password', 'level', 'experience', 'spells',
+                 'kingdoms_won', 'sword_awards', 'kingdom', 'magic', 'hp', 'max_hp',
+                 'mana', 'max_mana', 'inventory')
+# Field order of each schema version that stores rows. Version 1 stored dicts.
+SCHEMAS = {2: PLAYER_FIELDS}
+# Fields older saves may lack; the others are required.
+PLAYER_DEFAULTS = {'kingdom': "", 'magic': 10, 'hp': 100, 'max_hp': 100, 'mana': 50,
+                   'max_mana': 50, 'inventory': {"Health Potion": 2, "Mana Potion": 1}}
+
+SNAPSHOT_PREFIX = b'[{"schema":'
+
+
+class CodecError(ValueError):
+    pass
+
+
+# ------------------ JSON Backend ------------------ #
+def _select_backend(name):
+    """(backend name, dumps -> bytes, loads) for 'orjson', 'json' or None (the fastest installed)."""
+    if name in (None, 'orjson'):
+        try:
+            import orjson
+        except ImportError:
+            if name:
+                raise
+        else:
+            return 'orjson', orjson.dumps, orjson.loads
+    encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, check_circular=False)
+    return 'json', lambda data: encoder.encode(data).encode('utf-8'), json.loads
+
+
+BACKEND, dumps, loads = _select_backend(os.environ.get('MUD_JSON') or None)
+
+
+# ------------------ Rows ------------------ #
+def dict_to_row(data):
+    """A Player.to_dict() dict as a row, with defaults for missing optional fields."""
+    return [data[field] if field in data else PLAYER_DEFAULTS[field] for field in PLAYER_FIELDS]
+
+
+def row_to_dict(row):
+    return dict(zip(PLAYER_FIELDS, row))
+
+
+@functools.lru_cache(maxsize=None)
+def row_converter(fields):
+    """A function turning a row written with `fields` (a tuple) into a current row, or None if they match."""
+    if fields == PLAYER_FIELDS:
+        return None
+    positions = {field: position for position, field in enumerate(fields)}
+    missing = [field for field in PLAYER_FIELDS if field not in positions and field not in PLAYER_DEFAULTS]
+    if missing:
+        raise CodecError(f"player rows lack required field(s): {', '.join(missing)}")
+
+    def convert(row):
+        return [row[positions[field]] if field in positions else PLAYER_DEFAULTS[field]
+                for field in PLAYER_FIELDS]
+    return convert
+
+
+def schema_fields(schema):
+    try:
+        return SCHEMAS[schema]
+    except KeyError:
+        raise CodecError(f"unknown player schema {schema}") from None
+
+
+# ------------------ Snapshot Files ------------------ #
+def write_snapshot(file, rows):
+    """Write rows to a binary file as a schema 2 snapshot; returns how many were written."""
+    file.write(b'[' + dumps({'schema': SCHEMA_VERSION, 'fields': PLAYER_FIELDS}) + b'\n')
+    count = 0
+    for row in rows:
+        file.write(b',' + dumps(row) + b'\n')
+        count += 1
+    file.write(b']\n')
+    return count
+
+
+def read_snapshot(file, chunk_size=1 << 16):
+    """Yield the rows of a snapshot opened in binary mode, one at a time."""
+    head = file.read(len(SNAPSHOT_PREFIX))
+    if head != SNAPSHOT_PREFIX:
+        file.seek(0)
+        for data in _iter_json_list(file, chunk_size):
+            yield dict_to_row(data)
+        return
+    header = loads((head + file.readline())[1:])
+    if header['schema'] > SCHEMA_VERSION:
+        raise CodecError(f"players file has schema {header['schema']}; this version reads up to {SCHEMA_VERSION}")
+    convert = row_converter(tuple(header['fields']))
+    for line in file:
+        if line.startswith(b']'):
+            return
+        row = loads(line[1:])
+        yield row if convert is None else convert(row)
+    raise CodecError("players file ends before its closing ']'")
+
+
+def count_snapshot_rows(file, chunk_size=1 << 20):
+    """How many rows a snapshot opened in binary mode holds; schema 2 files are counted by line, not parsed."""
+    if file.read(len(SNAPSHOT_PREFIX)) != SNAPSHOT_PREFIX:
+        file.seek(0)
+        return sum(1 for _ in _iter_json_list(file, chunk_size))
+    lines = sum(chunk.count(b'\n') for chunk in iter(functools.partial(file.read, chunk_size), b''))
+    # The header line and the closing ']' hold no row
+    return lines - 2
+
+
+def _iter_json_list(file, chunk_size):
+    """Yield the items of a JSON list from a binary file, reading chunk_size bytes at a time."""
+    decode = json.JSONDecoder().raw_decode
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    started = eof = need_more = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if need_more or position == len(buffer):
+            if eof:
+                raise CodecError("players file ends in the middle of its list")
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + utf8.decode(chunk, final=eof)
+            position = 0
+            need_more = False
+            continue
+        if not started:
+            if buffer[position] != '[':
+                raise CodecError("players file is not a JSON list")
+            started = True
+            position += 1
+        elif buffer[position] == ']':
+            return
+        else:
+            try:
+                item, position = decode(buffer, position)
+            except json.JSONDecodeError as e:
+                # Usually an item cut off at the end of the buffer
+                if eof:
+                    raise CodecError(f"players file: {e}") from None
+                need_more = True
+                continue
+            yield item
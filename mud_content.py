@@ -0,0 +1,158 @@
+"""Game content (spells, enemies, kingdoms, swords, items) from content.json.
+
+The file is validated once when it is loaded and compiled into a Content:
+tuples and read-only mappings keyed exactly as the battle code looks them up,
+so a lookup during a fight is a single dict access that allocates nothing.
+
+A Content never changes. Reloading builds a new one and the game swaps it
+in; fights already under way keep the tables they started with.
+
+    {"spells": {"Fire": {"name": "Fireball", "cost": 10, "damage_range": [15, 25]}, ...},
+     "enemies": ["Goblin", ...],
+     "kingdoms": {"Clover": {"sword": "Demon Slayer"}, ...},
+     "items": {"Health Potion": {"restores": "hp", "amount": 30}, ...},
+     "starting_inventory": {"Health Potion": 2, ...}}
+"""
+import json
+import os
+import sys
+from types import MappingProxyType
+
+CONTENT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'content.json')
+SECTIONS = ('spells', 'enemies', 'kingdoms', 'items', 'starting_inventory')
+RESTORABLE = ('hp', 'mana')
+
+
+class ContentError(ValueError):
+    pass
+
+
+class Content:
+    """Compiled, read-only content tables.
+
+    spells              magic type -> {'name', 'cost', 'damage_range'}
+    magic_types         magic types, in file order
+    enemies             enemy names
+    kingdoms            kingdom names, in file order
+    swords              kingdom -> sword awarded for conquering it
+    items               item name (as written, and lower-cased) -> (attribute, amount)
+    starting_inventory  item name -> count for new players
+    """
+
+    def __init__(self, spells, enemies, kingdoms, items, starting_inventory, source=None):
+        self.source = source
+        self.spells = MappingProxyType({magic_type: MappingProxyType(spell) for magic_type, spell in spells.items()})
+        self.magic_types = tuple(spells)
+        self.enemies = tuple(enemies)
+        self.kingdoms = tuple(kingdoms)
+        self.swords = MappingProxyType(dict(kingdoms))
+        effects = {}
+        for name, effect in items.items():
+            effects[name] = effects[name.lower()] = effect
+        self.items = MappingProxyType(effects)
+        self.starting_inventory = MappingProxyType(dict(starting_inventory))
+
+
+def _fail(source, message):
+    raise ContentError(f"{source}: {message}")
+
+
+def _name(value, where, source):
+    if not isinstance(value, str) or not value.strip():
+        _fail(source, f"{where} must be a non-empty string")
+    return sys.intern(value)
+
+
+def _count(value, where, source, minimum=0):
+    # bool is an int subclass; true/false in the file is a mistake.
+    if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+        _fail(source, f"{where} must be an integer >= {minimum}")
+    return value
+
+
+def _section(data, key, kind, source, required=True):
+    # An optional section may be left out or empty, but is still type-checked.
+    value = data.get(key) if required else data.get(key, kind())
+    if not isinstance(value, kind) or (required and not value):
+        _fail(source, f"'{key}' must be a{' non-empty' if required else 'n'} {'object' if kind is dict else 'list'}")
+    return value
+
+
+def compile_content(data, source='<content>'):
+    """Validate parsed content.json data and compile it into a Content."""
+    if not isinstance(data, dict):
+        _fail(source, "content must be a JSON object")
+    unknown = set(data) - set(SECTIONS)
+    if unknown:
+        _fail(source, f"unknown section(s): {', '.join(sorted(unknown))}")
+
+    spells = {}
+    for magic_type, spell in _section(data, 'spells', dict, source).items():
+        where = f"spells.{magic_type}"
+        if not isinstance(spell, dict):
+            _fail(source, f"{where} must be an object")
+        damage = spell.get('damage_range')
+        if not isinstance(damage, list) or len(damage) != 2:
+            _fail(source, f"{where}.damage_range must be [min, max]")
+        low = _count(damage[0], f"{where}.damage_range", source)
+        high = _count(damage[1], f"{where}.damage_range", source)
+        if low > high:
+            _fail(source, f"{where}.damage_range has min above max")
+        spells[_name(magic_type, 'magic type', source)] = {
+            'name': _name(spell.get('name'), f"{where}.name", source),
+            'cost': _count(spell.get('cost'), f"{where}.cost", source),
+            'damage_range': (low, high)}
+
+    enemies = [_name(enemy, 'enemy name', source) for enemy in _section(data, 'enemies', list, source)]
+
+    kingdoms = {}
+    for kingdom, details in _section(data, 'kingdoms', dict, source).items():
+        if not isinstance(details, dict):
+            _fail(source, f"kingdoms.{kingdom} must be an object")
+        kingdoms[_name(kingdom, 'kingdom name', source)] = _name(details.get('sword'), f"kingdoms.{kingdom}.sword", source)
+    if len(set(kingdoms.values())) != len(kingdoms):
+        _fail(source, "every kingdom must award a different sword")
+
+    items = {}
+    for item, details in _section(data, 'items', dict, source).items():
+        where = f"items.{item}"
+        if not isinstance(details, dict) or details.get('restores') not in RESTORABLE:
+            _fail(source, f"{where}.restores must be one of: {', '.join(RESTORABLE)}")
+        items[_name(item, 'item name', source)] = (details['restores'], _count(details.get('amount'), f"{where}.amount", source, 1))
+    if len({item.lower() for item in items}) != len(items):
+        _fail(source, "item names must differ by more than case")
+
+    starting_inventory = {}
+    for item, count in _section(data, 'starting_inventory', dict, source, required=False).items():
+        starting_inventory[_name(item, 'starting_inventory item', source)] = _count(count, f"starting_inventory.{item}", source)
+
+    return Content(spells, enemies, kingdoms, items, starting_inventory, source)
+
+
+def load_content(path=CONTENT_FILE):
+    with open(path, 'r') as file:
+        try:
+            data = json.load(file)
+        except ValueError as e:     # Not JSON, or not UTF-8
+            raise ContentError(f"{path}: {e}") from None
+    return compile_content(data, path)
+
+
+class ContentFile:
+    """A content file, remembering which version of it was last read."""
+
+    def __init__(self, path=CONTENT_FILE):
+        self.path = path
+        self.mtime = None
+
+    def changed(self):
+        try:
+            return os.stat(self.path).st_mtime_ns != self.mtime
+        except OSError:
+            return False
+
+    def load(self):
+        # Noted before parsing, so a broken file is reported once rather than
+        # on every check until it is fixed.
+        self.mtime = os.stat(self.path).st_mtime_ns
+        return load_content(self.path)
@@ -1,6 +1,26 @@
+import argparse
+import asyncio
 import os
 import random
-import json
+import bisect
+import collections
+import itertools
+import sys
+import weakref
+import contextvars
+import functools
+import heapq
+import re
+
+from mud_actionlog import CHECK, LOAD, LOGIN, ActionLog, Secret, new_seed, note_denied, note_player, recorded
+from mud_auth import PasswordHasher, add_cost_arguments, cost_from_args, verify_password
+from mud_autosave import add_autosave_arguments, autosaver_from_args
+from mud_battle import ACTIONS, DEFAULT_TUNING, Fight, attempt_quest
+from mud_codec import PLAYER_DEFAULTS, PLAYER_FIELDS, dict_to_row
+from mud_content import CONTENT_FILE, ContentError, ContentFile
+from mud_metrics import METRICS, Gauge, serve_metrics
+from mud_snapshot import PlayerSnapshot, player_entry, write_player_snapshot
+from mud_storage import JsonStore, open_store
 
 
 # ------------------ ANSI Color Class ------------------ #
@@ -16,9 +36,67 @@ class Color:
     MAGENTA = '\033[95m'
 
 
+# ------------------ Output Routing ------------------ #
+# Game text goes through say() instead of print() so that each session (the
+# console in play(), or a network client) can collect it in its own
+# ScreenBuffer. Outside a session the writer is unset and say() prints.
+current_output = contextvars.ContextVar('current_output', default=None)
+
+
+def say(*args, sep=' ', end='\n'):
+    writer = current_output.get()
+    if writer is None:
+        print(*args, sep=sep, end=end)
+    else:
+        writer(sep.join(str(arg) for arg in args) + end)
+
+
+ANSI_ESCAPES = re.compile(r'\033\[[0-9;]*m')
+
+
+@functools.lru_cache(maxsize=1024)
+def strip_color(text):
+    # Cached, so the pre-rendered screens are only stripped once.
+    return ANSI_ESCAPES.sub('', text)
+
+
+class ScreenBuffer:
+    """Collects everything said until the next prompt, then writes it at once.
+
+    One write per prompt instead of one per line keeps syscalls (and, over
+    the network, packets) down. With color=False, ANSI color codes are
+    stripped for clients that do not understand them.
+    """
+
+    def __init__(self, write, color=True):
+        self.write = write
+        self.color = color
+        self.parts = []
+        self.writes = 0
+        self.bytes_written = 0
+
+    def __call__(self, text):
+        self.parts.append(text if self.color else strip_color(text))
+
+    def flush(self, prompt=''):
+        if prompt:
+            self(prompt)
+        if not self.parts:
+            return
+        text = ''.join(self.parts)
+        self.parts.clear()
+        self.write(text)
+        self.writes += 1
+        self.bytes_written += len(text)
+
+
+def use_color():
+    # https://no-color.org: any non-empty NO_COLOR disables color.
+    return not os.environ.get('NO_COLOR')
+
+
 # ------------------ ASCII Art & Story ------------------ #
-def display_ascii_art():
-    ascii_art = r"""
+ASCII_ART = r"""
 __________.__                 __            .__                            
 \______   \  | _____    ____ |  | __   ____ |  |   _______  __ ___________ 
  |    |  _/  | \__  \ _/ ___\|  |/ / _/ ___\|  |  /  _ \  \/ // __ \_  __ \
@@ -26,7 +104,10 @@ __________.__                 __            .__
  |______  /____(____  /\___  >__|_ \  \___  >____/\____/ \_/  \___  >__|    
         \/          \/     \/     \/      \/                      \/       
 """
-    print(ascii_art)
+
+
+def display_ascii_art():
+    say(ASCII_ART)
 
 
 STORY_TEXT = """
@@ -37,18 +118,112 @@ Only the strongest and most strategic will survive the trials ahead.
 Are you ready to embark on your journey?
 """
 
+# Screens that never change are built once rather than line by line.
+MAIN_MENU = "\n".join([
+    "\n" + Color.BOLD + "MAIN MENU" + Color.RESET,
+    "1. " + Color.BLUE + "Create a new player" + Color.RESET,
+    "2. " + Color.BLUE + "Log in" + Color.RESET,
+    "3. " + Color.BLUE + "Choose Kingdom (for active player)" + Color.RESET,
+    "4. " + Color.BLUE + "List players" + Color.RESET,
+    "5. " + Color.BLUE + "Leaderboard" + Color.RESET,
+    "6. " + Color.BLUE + "Save Game (active player)" + Color.RESET,
+    "7. " + Color.BLUE + "Load Game" + Color.RESET,
+    "8. " + Color.BLUE + "Delete Player Data" + Color.RESET,
+    "9. " + Color.BLUE + "Embark on a Quest" + Color.RESET,
+    "10. " + Color.RED + "Exit" + Color.RESET,
+]) + "\n"
+
+BATTLE_ACTIONS_MENU = "\n".join([
+    "Choose your action:",
+    "1. Attack",
+    "2. Cast Spell",
+    "3. Defend",
+    "4. Use Item",
+    "5. Flee",
+]) + "\n"
+
+
+# ------------------ Interned Names ------------------ #
+class CodeTable:
+    """A family of names (magic types, kingdoms, swords) numbered 0, 1, 2, ...
+
+    Players store the small-int code, or a tuple of codes for a list of names,
+    instead of their own copy of each string. Names not seen before (say, from
+    an older save file) are given the next free code. Equal tuples are shared,
+    so players who earned the same things in the same order hold one object.
+    """
+
+    def __init__(self, names=()):
+        self.names = []
+        self.codes = {}
+        self.sequences = {}     # tuple of codes -> the shared copy of it
+        for name in names:
+            self.code(name)
+
+    def code(self, name):
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(sys.intern(name))
+        return code
+
+    def sequence(self, names):
+        """The codes of names in their order, without repeats, as a shared tuple."""
+        codes = []
+        for name in names:
+            code = self.code(name)
+            if code not in codes:
+                codes.append(code)
+        codes = tuple(codes)
+        return self.sequences.setdefault(codes, codes)
+
+    def extended(self, sequence, name):
+        """sequence with name's code added at the end, unless it is already in it."""
+        code = self.code(name)
+        if code in sequence:
+            return sequence
+        codes = sequence + (code,)
+        return self.sequences.setdefault(codes, codes)
+
+    def names_of(self, sequence):
+        names = self.names
+        return [names[code] for code in sequence]
+
+
+# Seeded from the game's content when it is loaded (see BlackCloverMUD);
+# names from saves or reloaded content get the next free codes.
+MAGIC_TYPES = CodeTable()
+KINGDOMS = CodeTable()
+SWORDS = CodeTable()
+
+
+def seed_codes(content):
+    for magic_type in content.magic_types:
+        MAGIC_TYPES.code(magic_type)
+    for kingdom, sword in content.swords.items():
+        KINGDOMS.code(kingdom)
+        SWORDS.code(sword)
+
 
 # ------------------ Player Class ------------------ #
 class Player:
+    # Slots instead of a per-instance __dict__ keep each player small when the
+    # whole roster is in memory. Magic type is a MAGIC_TYPES code; kingdoms
+    # won and swords earned are shared tuples of KINGDOMS and SWORDS codes, in
+    # the order they were won.
+    __slots__ = ('name', 'magic_code', 'password', 'level', 'experience', 'spells',
+                 'kingdom_codes', 'sword_codes', 'kingdom', 'magic', 'hp', 'max_hp',
+                 'mana', 'max_mana', 'inventory', 'dirty', '__weakref__')
+
     def __init__(self, name, magic_type, password):
         self.name = name
         self.magic_type = magic_type
-        self.password = password
+        self.password = password    # A mud_auth hash (plaintext in old saves)
         self.level = 1
         self.experience = 0
         self.spells = []  # Additional spells can be added
-        self.kingdoms_won = []   # Kingdoms the player has conquered
-        self.sword_awards = []   # Swords earned from elite battles
+        self.kingdom_codes = ()  # Kingdoms the player has conquered
+        self.sword_codes = ()    # Swords earned from elite battles
         self.kingdom = ""        # Current kingdom engaged
         self.magic = 10          # Generic magic attribute (unused so far)
         # New attributes for interactive battle
@@ -56,11 +231,56 @@ class Player:
         self.max_hp = 100
         self.mana = 50
         self.max_mana = 50
-        self.inventory = {"Health Potion": 2, "Mana Potion": 1}
+        self.inventory = dict(PLAYER_DEFAULTS['inventory'])   # create_player gives the content's
+        self.dirty = True        # Changed since last saved to players' data
+
+    @property
+    def magic_type(self):
+        return MAGIC_TYPES.names[self.magic_code]
+
+    @magic_type.setter
+    def magic_type(self, magic_type):
+        self.magic_code = MAGIC_TYPES.code(magic_type)
+
+    @property
+    def kingdoms_won(self):
+        return KINGDOMS.names_of(self.kingdom_codes)
+
+    @kingdoms_won.setter
+    def kingdoms_won(self, kingdoms):
+        self.kingdom_codes = KINGDOMS.sequence(kingdoms)
+
+    @property
+    def sword_awards(self):
+        return SWORDS.names_of(self.sword_codes)
+
+    @sword_awards.setter
+    def sword_awards(self, swords):
+        self.sword_codes = SWORDS.sequence(swords)
+
+    @property
+    def sword_count(self):
+        return len(self.sword_codes)
+
+    def has_won(self, kingdom):
+        return KINGDOMS.code(kingdom) in self.kingdom_codes
+
+    def win_kingdom(self, kingdom, sword):
+        self.kingdom_codes = KINGDOMS.extended(self.kingdom_codes, kingdom)
+        self.sword_codes = SWORDS.extended(self.sword_codes, sword)
+        self.dirty = True
+
+    def is_wizard_king(self, swords):
+        """Whether the player holds every sword named in `swords`."""
+        held = self.sword_codes
+        return all(SWORDS.codes.get(sword) in held for sword in swords)
+
+    def mark_dirty(self):
+        self.dirty = True
 
     def level_up(self):
         self.level += 1
-        print(f"{self.name} leveled up to level {self.level}!")
+        self.dirty = True
         # Increase max HP and Mana with level (optional)
         self.max_hp += 10
         self.max_mana += 5
@@ -73,372 +293,1075 @@ class Player:
         if self.mana >= spell['cost']:
             self.mana -= spell['cost']
             damage = random.randint(*spell['damage_range'])
-            print(f"{self.name} casts {spell['name']} for {damage} damage (cost {spell['cost']} mana)!")
+            say(f"{self.name} casts {spell['name']} for {damage} damage (cost {spell['cost']} mana)!")
             return damage
         else:
-            print("Not enough mana!")
+            say("Not enough mana!")
             return 0
 
     def login(self, entered_password):
-        return entered_password == self.password
+        return verify_password(entered_password, self.password)
+
+    def to_row(self):
+        """The player's fields in mud_codec.PLAYER_FIELDS order."""
+        return [self.name, self.magic_type, self.password, self.level, self.experience, self.spells,
+                self.kingdoms_won, self.sword_awards, self.kingdom, self.magic, self.hp, self.max_hp,
+                self.mana, self.max_mana, self.inventory]
 
     def to_dict(self):
-        return {
-            'name': self.name,
-            'magic_type': self.magic_type,
-            'password': self.password,
-            'level': self.level,
-            'experience': self.experience,
-            'spells': self.spells,
-            'kingdoms_won': self.kingdoms_won,
-            'sword_awards': self.sword_awards,
-            'kingdom': self.kingdom,
-            'magic': self.magic,
-            'hp': self.hp,
-            'max_hp': self.max_hp,
-            'mana': self.mana,
-            'max_mana': self.max_mana,
-            'inventory': self.inventory
-        }
+        return dict(zip(PLAYER_FIELDS, self.to_row()))
+
+    @classmethod
+    def from_row(cls, row):
+        (name, magic_type, password, level, experience, spells, kingdoms_won, sword_awards,
+         kingdom, magic, hp, max_hp, mana, max_mana, inventory) = row
+        # Every slot is set here, so __init__'s defaults would only be overwritten
+        player = cls.__new__(cls)
+        player.name = name
+        player.magic_code = MAGIC_TYPES.code(magic_type)
+        player.password = password
+        player.level = level
+        player.experience = experience
+        player.spells = spells
+        player.kingdom_codes = KINGDOMS.sequence(kingdoms_won)
+        player.sword_codes = SWORDS.sequence(sword_awards)
+        player.kingdom = sys.intern(kingdom)
+        player.magic = magic
+        player.hp = hp
+        player.max_hp = max_hp
+        player.mana = mana
+        player.max_mana = max_mana
+        player.inventory = {sys.intern(item): count for item, count in inventory.items()}
+        player.dirty = False
+        return player
 
     @classmethod
     def from_dict(cls, data):
-        player = cls(data['name'], data['magic_type'], data['password'])
-        player.level = data['level']
-        player.experience = data['experience']
-        player.spells = data['spells']
-        player.kingdoms_won = data['kingdoms_won']
-        player.sword_awards = data['sword_awards']
-        player.kingdom = data.get('kingdom', "")
-        player.magic = data.get('magic', 10)
-        player.hp = data.get('hp', 100)
-        player.max_hp = data.get('max_hp', 100)
-        player.mana = data.get('mana', 50)
-        player.max_mana = data.get('max_mana', 50)
-        player.inventory = data.get('inventory', {"Health Potion": 2, "Mana Potion": 1})
+        return cls.from_row(dict_to_row(data))
+
+    def copy(self):
+        """A detached copy sharing no mutable state, safe to hand to another thread."""
+        player = Player.from_row(self.to_row())     # from_row rebuilds the inventory
+        player.spells = list(self.spells)
         return player
 
+    @classmethod
+    def from_record(cls, record):
+        """A player from a store record: a to_row() list or a to_dict() dict."""
+        return cls.from_row(record) if isinstance(record, list) else cls.from_dict(record)
+
+
+# ------------------ Leaderboard ------------------ #
+class Leaderboard:
+    """Players ranked by (number of swords, level), highest first.
+
+    Players are kept by name key in buckets, one per distinct rank key, with
+    the keys held in sorted order. A change to one player moves it between
+    two buckets, so nothing is re-sorted, and queries only walk as many
+    buckets as they need. Players with the same key share a rank.
+    """
+
+    def __init__(self):
+        self._buckets = {}      # rank key -> {name key: None}, in arrival order
+        self._keys = []         # distinct rank keys, ascending
+        self._key_of = {}       # name key -> current rank key
+
+    @staticmethod
+    def rank_key(player):
+        return (player.sword_count, player.level)
+
+    def __len__(self):
+        return len(self._key_of)
+
+    def update(self, name_key, rank_key):
+        old_key = self._key_of.get(name_key)
+        if old_key == rank_key:
+            return
+        if old_key is not None:
+            self._take(name_key, old_key)
+        bucket = self._buckets.get(rank_key)
+        if bucket is None:
+            bucket = self._buckets[rank_key] = {}
+            bisect.insort(self._keys, rank_key)
+        bucket[name_key] = None
+        self._key_of[name_key] = rank_key
+
+    def remove(self, name_key):
+        old_key = self._key_of.pop(name_key, None)
+        if old_key is not None:
+            self._take(name_key, old_key)
+
+    def _take(self, name_key, rank_key):
+        bucket = self._buckets[rank_key]
+        del bucket[name_key]
+        if not bucket:
+            del self._buckets[rank_key]
+            del self._keys[bisect.bisect_left(self._keys, rank_key)]
+
+    def page(self, offset=0, limit=10):
+        """Name keys at positions offset .. offset+limit-1, best first."""
+        result = []
+        for rank_key in reversed(self._keys):
+            if limit is not None and len(result) >= limit:
+                break
+            bucket = self._buckets[rank_key]
+            if offset >= len(bucket):
+                offset -= len(bucket)
+                continue
+            stop = None if limit is None else offset + limit - len(result)
+            result.extend(itertools.islice(bucket, offset, stop))
+            offset = 0
+        return result
+
+    def top(self, k=10):
+        return self.page(0, k)
+
+    def counts(self):
+        """(rank key, number of players) for each distinct rank key, best first."""
+        return [(rank_key, len(self._buckets[rank_key])) for rank_key in reversed(self._keys)]
+
+    def rank_of(self, name_key):
+        """1 + the number of players strictly ahead, or None if unranked."""
+        rank_key = self._key_of.get(name_key)
+        if rank_key is None:
+            return None
+        return self.ahead_of(rank_key) + 1
+
+    def ahead_of(self, rank_key):
+        """The number of players with a higher rank key."""
+        ahead = 0
+        for higher in self._keys[bisect.bisect_right(self._keys, rank_key):]:
+            ahead += len(self._buckets[higher])
+        return ahead
+
+
+class SnapshotLeaderboard(Leaderboard):
+    """A Leaderboard over a mud_snapshot.PlayerSnapshot plus the players held in memory.
+
+    The snapshot's players are ranked in the file already. Players loaded
+    from it, added or deleted shadow their snapshot entry (see shadow()) and
+    are ranked by the Leaderboard part instead. Pages merge the two, with
+    snapshot players first among equal rank keys.
+    """
+
+    def __init__(self, snapshot):
+        super().__init__()
+        self.snapshot = snapshot
+        self.shadowed = set()                       # snapshot numbers no longer current
+        self._shadowed_keys = collections.Counter() # their snapshot rank keys
+
+    def shadow(self, number):
+        if number not in self.shadowed:
+            self.shadowed.add(number)
+            self._shadowed_keys[self.snapshot.rank_key(number)] += 1
+
+    def __len__(self):
+        return super().__len__() + len(self.snapshot) - len(self.shadowed)
+
+    def _snapshot_ranked(self):
+        snapshot = self.snapshot
+        for number in snapshot.ranked:
+            if number not in self.shadowed:
+                yield snapshot.rank_key(number), snapshot.key(number)
+
+    def page(self, offset=0, limit=10):
+        stop = None if limit is None else offset + limit
+        loaded = ((self._key_of[key], key) for key in super().page(0, stop))
+        merged = heapq.merge(self._snapshot_ranked(), loaded, key=lambda entry: entry[0], reverse=True)
+        return [key for _, key in itertools.islice(merged, offset, stop)]
+
+    def rank_of(self, name_key):
+        rank_key = self._key_of.get(name_key)
+        if rank_key is None:
+            number = self.snapshot.find(name_key)
+            if number is None or number in self.shadowed:
+                return None
+            rank_key = self.snapshot.rank_key(number)
+        return self.ahead_of(rank_key) + 1
+
+    def ahead_of(self, rank_key):
+        ahead = super().ahead_of(rank_key)
+        ahead += sum(count for key, count in self.snapshot.rank_counts if key > rank_key)
+        ahead -= sum(count for key, count in self._shadowed_keys.items() if key > rank_key)
+        return ahead
+
+    def counts(self):
+        counts = collections.Counter(dict(self.snapshot.rank_counts))
+        counts.subtract(self._shadowed_keys)
+        counts.update(dict(super().counts()))
+        return [(rank_key, counts[rank_key]) for rank_key in sorted(counts, reverse=True) if counts[rank_key]]
+
+
+# ------------------ Player Registry ------------------ #
+class PlayerRegistry:
+    """All known players, indexed by case-folded name.
+
+    Lookups, inserts and deletes are dict operations instead of scans over
+    every player. Iteration keeps insertion order, like the list it replaces.
+    Secondary indexes group players by magic type and by kingdom won, and the
+    leaderboard ranks them; call reindex() after changing a registered
+    player's level, sword_awards or kingdoms_won.
+    """
+
+    def __init__(self, players=()):
+        self._by_name = {}
+        self._by_magic = {}     # magic type -> {name key: None}
+        self._by_kingdom = {}   # kingdom -> {name key: None}
+        self._kingdoms_of = {}
+        self.leaderboard = Leaderboard()
+        for player in players:
+            self.add(player)
+
+    @staticmethod
+    def key(name):
+        return name.casefold()
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def __iter__(self):
+        return iter(self._by_name.values())
+
+    def __contains__(self, name):
+        return self.key(name) in self._by_name
+
+    def get(self, name):
+        return self._player(self.key(name))
+
+    def held(self, name):
+        """The player if it is in memory already, else None; never reads the store."""
+        return self.get(name)
+
+    def _player(self, key):
+        return self._by_name.get(key)
+
+    def add(self, player):
+        key = self.key(player.name)
+        if key in self._by_name:
+            self._unindex(key, self._by_name[key].magic_type)
+        self._by_name[key] = player
+        self._index(key, player.magic_type, player.kingdoms_won, Leaderboard.rank_key(player))
+
+    def remove(self, player):
+        key = self.key(player.name)
+        if self._by_name.get(key) is player:
+            del self._by_name[key]
+            self._unindex(key, player.magic_type)
+
+    def reindex(self, player):
+        key = self.key(player.name)
+        if self._by_name.get(key) is player:
+            self._unindex_kingdoms(key)
+            self._index(key, player.magic_type, player.kingdoms_won, Leaderboard.rank_key(player))
+
+    def by_magic_type(self, magic_type):
+        return [self._player(key) for key in self._by_magic.get(magic_type, ())]
+
+    def by_kingdom_won(self, kingdom):
+        return [self._player(key) for key in self._by_kingdom.get(kingdom, ())]
+
+    def leaderboard_page(self, offset=0, limit=10):
+        return [self._player(key) for key in self.leaderboard.page(offset, limit)]
+
+    def summaries(self):
+        """(name, magic type) for every player, without loading anything."""
+        return ((player.name, player.magic_type) for player in self)
+
+    def dirty_players(self):
+        return [player for player in self if player.dirty]
+
+    def snapshot_entries(self):
+        """Every player as mud_snapshot.player_entry() gives it, for write_player_snapshot."""
+        return map(player_entry, self)
+
+    def stats(self):
+        """Counts for metrics: 'players' in the roster and 'loaded', the Player objects held in memory."""
+        return {'players': len(self), 'loaded': len(self._by_name)}
+
+    def _index(self, key, magic_type, kingdoms_won, rank_key):
+        self._by_magic.setdefault(magic_type, {})[key] = None
+        kingdoms = frozenset(kingdoms_won)
+        for kingdom in kingdoms:
+            self._by_kingdom.setdefault(kingdom, {})[key] = None
+        self._kingdoms_of[key] = kingdoms
+        self.leaderboard.update(key, rank_key)
+
+    def _unindex(self, key, magic_type):
+        self._by_magic.get(magic_type, {}).pop(key, None)
+        self._unindex_kingdoms(key)
+        self.leaderboard.remove(key)
+
+    def _unindex_kingdoms(self, key):
+        for kingdom in self._kingdoms_of.pop(key, ()):
+            self._by_kingdom.get(kingdom, {}).pop(key, None)
+
+
+class LazyPlayerRegistry(PlayerRegistry):
+    """A PlayerRegistry that keeps only a name index in memory.
+
+    Startup reads one compact summary row per player from the store, enough
+    for the name, magic type, kingdom and leaderboard indexes. Full Player
+    objects are loaded from the store on first access and kept in an LRU
+    cache of at most `capacity` players; the least recently used one is
+    evicted, and written back first if it is dirty. A player evicted while
+    something (such as a session's active player) still holds it is adopted
+    again on next access, so there is never a second copy of a live player.
+    """
+
+    def __init__(self, store, capacity=10000, autosave=None):
+        super().__init__()
+        self.store = store
+        self.capacity = capacity
+        self.autosave = autosave                     # Writes back evicted players, if given
+        self._by_name = collections.OrderedDict()   # LRU cache of loaded players
+        self._known = {}                             # name key -> (name, magic type)
+        self._evicted = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.write_backs = 0
+        for name, magic_type, level, sword_count, kingdoms_won in store.load_index():
+            key = self.key(name)
+            self._known[key] = (name, sys.intern(magic_type))
+            self._index(key, magic_type, kingdoms_won, (sword_count, level))
+
+    def __len__(self):
+        return len(self._known)
+
+    def __iter__(self):
+        for key in list(self._known):
+            yield self._player(key)
+
+    def __contains__(self, name):
+        return self.key(name) in self._known
+
+    def _player(self, key):
+        player = self._held(key)
+        if player is None and key in self._known:
+            data = self.store.load_player(self._known[key][0])
+            if data is not None:
+                player = self.adopt(data)
+        return player
+
+    def held(self, name):
+        return self._held(self.key(name))
+
+    def _held(self, key):
+        player = self._by_name.get(key)
+        if player is not None:
+            self.hits += 1
+            self._by_name.move_to_end(key)
+            return player
+        player = self._evicted.pop(key, None)
+        if player is not None:
+            self.misses += 1
+            self._cache(key, player)
+        return player
+
+    def adopt(self, data):
+        """Cache a player from store.load_player data read elsewhere; returns the registered player.
+
+        None if the player was deleted meanwhile; if it was loaded meanwhile,
+        that player is kept and data is dropped.
+        """
+        key = self.key(data['name'])
+        if key not in self._known:
+            return None
+        player = self._held(key)
+        if player is None:
+            self.misses += 1
+            player = Player.from_dict(data)
+            self._cache(key, player)
+        return player
+
+    def _cache(self, key, player):
+        self._by_name[key] = player
+        while len(self._by_name) > self.capacity:
+            old_key, old_player = self._by_name.popitem(last=False)
+            if old_player.dirty:
+                if self.autosave is not None:
+                    self.autosave.note(old_player)
+                else:
+                    self.store.save_players([old_player], self)
+                    old_player.dirty = False
+                self.write_backs += 1
+            self._evicted[old_key] = old_player
+            self.evictions += 1
+
+    def add(self, player):
+        key = self.key(player.name)
+        if key in self._known:
+            self._unindex(key, self._known[key][1])
+        self._evicted.pop(key, None)
+        self._known[key] = (player.name, sys.intern(player.magic_type))
+        self._index(key, player.magic_type, player.kingdoms_won, Leaderboard.rank_key(player))
+        self._cache(key, player)
+
+    def remove(self, player):
+        key = self.key(player.name)
+        if key in self._known:
+            del self._known[key]
+            self._by_name.pop(key, None)
+            self._evicted.pop(key, None)
+            self._unindex(key, player.magic_type)
+
+    def reindex(self, player):
+        key = self.key(player.name)
+        if key in self._known:
+            self._unindex_kingdoms(key)
+            self._index(key, player.magic_type, player.kingdoms_won, Leaderboard.rank_key(player))
+
+    def summaries(self):
+        return iter(self._known.values())
+
+    def dirty_players(self):
+        # Evicted players were clean when they left the cache, but a session
+        # may have changed them since.
+        players = list(self._by_name.values()) + list(self._evicted.values())
+        return [player for player in players if player.dirty]
+
+    def stats(self):
+        return {'players': len(self._known), 'loaded': len(self._by_name), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions, 'write_backs': self.write_backs}
+
+
+class SnapshotRegistry(PlayerRegistry):
+    """A PlayerRegistry over a mud_snapshot.PlayerSnapshot, decoding players when touched.
+
+    Opening it costs nothing per player: lookups use the snapshot's name
+    table and the leaderboard its ranked column (see SnapshotLeaderboard).
+    A player is decoded on first access and from then on held in memory
+    like in a PlayerRegistry, shadowing its snapshot entry; so are players
+    added later. Iterating decodes untouched players afresh each time
+    without keeping them, and dirty_players() only looks at those held.
+    by_magic_type and by_kingdom_won use indexes written with the snapshot
+    and return SnapshotMatches, which iterate the same way.
+    """
+
+    def __init__(self, snapshot):
+        super().__init__()
+        self.snapshot = snapshot
+        self.leaderboard = SnapshotLeaderboard(snapshot)
+        self.shadowed = self.leaderboard.shadowed
+        self._added = {}        # name key -> None for players held that are not in the snapshot
+
+    def __len__(self):
+        return len(self.snapshot) - len(self.shadowed) + len(self._by_name)
+
+    def __iter__(self):
+        snapshot = self.snapshot
+        for number in range(len(snapshot)):
+            if number in self.shadowed:
+                player = self._by_name.get(snapshot.key(number))
+                if player is not None:
+                    yield player
+            else:
+                yield Player.from_row(snapshot.row(number))
+        for key in list(self._added):
+            yield self._by_name[key]
+
+    def __contains__(self, name):
+        return self._player_number(self.key(name)) is not None or self.key(name) in self._by_name
+
+    def _player_number(self, key):
+        """The snapshot number of an untouched player, or None."""
+        number = self.snapshot.find(key)
+        return None if number is None or number in self.shadowed else number
+
+    def _player(self, key):
+        player = self._by_name.get(key)
+        if player is not None:
+            return player
+        number = self._player_number(key)
+        if number is None:
+            return None
+        player = Player.from_row(self.snapshot.row(number))
+        self.leaderboard.shadow(number)
+        super().add(player)
+        return player
+
+    def add(self, player):
+        key = self.key(player.name)
+        number = self.snapshot.find(key)
+        if number is None:
+            self._added[key] = None
+        else:
+            self.leaderboard.shadow(number)
+        super().add(player)
+
+    def remove(self, player):
+        key = self.key(player.name)
+        if self._by_name.get(key) is player:
+            self._added.pop(key, None)
+            super().remove(player)
+
+    def by_magic_type(self, magic_type):
+        return SnapshotMatches(self, self.snapshot.with_magic_type(magic_type), super().by_magic_type(magic_type))
+
+    def by_kingdom_won(self, kingdom):
+        return SnapshotMatches(self, self.snapshot.with_kingdom_won(kingdom), super().by_kingdom_won(kingdom))
+
+    def summaries(self):
+        snapshot = self.snapshot
+        shadowed = self.shadowed
+        names, offsets, magic, magic_types = snapshot.names, snapshot.name_offsets, snapshot.magic, snapshot.magic_types
+        for number in range(len(snapshot)):
+            if number in shadowed:
+                player = self._by_name.get(snapshot.key(number))
+                if player is not None:
+                    yield player.name, player.magic_type
+            else:
+                yield str(names[offsets[number]:offsets[number + 1]], 'utf-8'), magic_types[magic[number]]
+        for key in list(self._added):
+            player = self._by_name[key]
+            yield player.name, player.magic_type
+
+    def dirty_players(self):
+        return [player for player in self._by_name.values() if player.dirty]
+
+    def snapshot_entries(self):
+        # Untouched players are copied from the old snapshot without decoding
+        snapshot = self.snapshot
+        for number in range(len(snapshot)):
+            if number in self.shadowed:
+                player = self._by_name.get(snapshot.key(number))
+                if player is not None:
+                    yield player_entry(player)
+            else:
+                yield snapshot.entry(number)
+        for key in list(self._added):
+            yield player_entry(self._by_name[key])
+
+
+class SnapshotMatches:
+    """The players a SnapshotRegistry query matched: snapshot numbers from its index, plus players held.
+
+    Nothing is decoded up front. Iterating decodes the untouched players
+    afresh without keeping them, as iterating the registry does.
+    """
+
+    def __init__(self, registry, numbers, held):
+        self.registry = registry
+        self.numbers = numbers
+        self.held = held
+
+    def __len__(self):
+        shadowed = self.registry.shadowed
+        return sum(number not in shadowed for number in self.numbers) + len(self.held)
+
+    def __iter__(self):
+        snapshot = self.registry.snapshot
+        shadowed = self.registry.shadowed
+        for number in self.numbers:
+            if number not in shadowed:
+                yield Player.from_row(snapshot.row(number))
+        yield from self.held
+
 
 # ------------------ BlackCloverMUD Class ------------------ #
+# Metric labels built once, so instrumented paths allocate nothing.
+MENU_LABELS = {str(option): (('choice', str(option)),) for option in range(1, 11)}
+INVALID_MENU_LABEL = (('choice', 'invalid'),)
+OUTCOME_LABELS = {outcome: (('outcome', outcome),) for outcome in ('won', 'lost', 'fled')}
+LOGIN_LABELS = {result: (('result', result),) for result in ('ok', 'unknown_player', 'wrong_password')}
+SAVE_PLAYER_LABEL = (('what', 'player'),)
+SAVE_ROSTER_LABEL = (('what', 'roster'),)
+SNAPSHOT_LABEL = (('what', 'snapshot'),)
+
 class BlackCloverMUD:
     data_folder = "LoadData"
-    valid_magic_types = ["Fire", "Water", "Wind", "Earth", "Lightning"]
+    valid_magic_types = ["Fire", "Water", "Wind", "Earth", "Lightning"]   # As shipped; see self.content
     levels = ['Ignite', 'Illuminate', 'Elite']
 
-    def __init__(self):
-        self.players = []
-        if not os.path.exists(self.data_folder):
-            os.makedirs(self.data_folder)
+    def __init__(self, store=None, cache_size=None, hasher=None, content_path=CONTENT_FILE, autosave=None):
+        self.players = PlayerRegistry()
+        if store is None:
+            os.makedirs(self.data_folder, exist_ok=True)
+            store = JsonStore(self.data_folder)
+        self.store = store
+        # With a cache size, players are loaded on demand (see LazyPlayerRegistry).
+        self.cache_size = cache_size
+        # Without workers passwords are hashed inline; a server gives the
+        # hasher a pool so logins do not block other sessions.
+        self.hasher = hasher or PasswordHasher()
+        # Spells, enemies, kingdoms and items; see reload_content
+        self.content_file = ContentFile(content_path)
+        self.content = self.content_file.load()
+        seed_codes(self.content)
+        self.intro = None       # Banner, story and welcome.txt, built on first use
+        # A server sets this to a mud_world.World so battle turns and quests
+        # resolve on its shared tick instead of immediately.
+        self.world = None
+        # A mud_autosave.Autosaver writing changed players in the background;
+        # without one they are saved only by Save Game and on exit.
+        self.autosave = autosave
+        # A server sets this to a thread pool so store reads (Load Game, and
+        # players loaded on demand) do not block the event loop; see reading.
+        self.read_pool = None
+        self._reads = {}        # name key -> future of a store read under way
+
+    def player_changed(self, player):
+        """Mark the player changed and queue it for the autosave, if there is one."""
+        player.mark_dirty()
+        if self.autosave is not None:
+            self.autosave.note(player)
+
+    # -------- Password Hashing -------- #
+    def hashing(self, func, *args):
+        """Generator returning func(*args), yielding a future while it runs on the hasher's pool."""
+        if self.hasher.pool is None:
+            return func(*args)
+        return (yield self.hasher.submit(func, *args))
+
+    # -------- Store Reads -------- #
+    def reading(self, func, *args):
+        """Generator returning func(*args), yielding a future while it runs on the read pool (see hashing)."""
+        if self.read_pool is None:
+            return func(*args)
+        return (yield asyncio.get_running_loop().run_in_executor(self.read_pool, func, *args))
+
+    def fetching_player(self, name):
+        """Generator (see reading) returning the registered player named name, or None.
+
+        A player that is not in memory (see LazyPlayerRegistry) is read from
+        the store through reading(); sessions asking for the same player
+        meanwhile wait on the same read.
+        """
+        player = self.players.held(name)
+        if player is not None or name not in self.players:
+            return player
+        if self.read_pool is None:
+            return self.players.get(name)
+        key = self.players.key(name)
+        read = self._reads.get(key)
+        if read is None:
+            read = self._reads[key] = asyncio.get_running_loop().run_in_executor(
+                self.read_pool, self.store.load_player, name)
+            read.add_done_callback(lambda _: self._reads.pop(key, None))
+        data = yield read
+        return None if data is None else self.players.adopt(data)
 
     # -------- Player Creation -------- #
     def create_player(self, name, magic_type, password):
-        for player in self.players:
-            if player.name.lower() == name.lower():
-                print("Username already taken. Please choose a different name.")
-                return False
+        """Generator (see hashing) returning whether the player was created."""
+        if name in self.players:
+            say("Username already taken. Please choose a different name.")
+            return False
 
-        if magic_type.capitalize() not in self.valid_magic_types:
-            print("Invalid magic type. Please choose from:", ", ".join(self.valid_magic_types))
+        if magic_type.capitalize() not in self.content.spells:
+            say("Invalid magic type. Please choose from:", ", ".join(self.content.magic_types))
             return False
 
-        player = Player(name, magic_type.capitalize(), password)
-        self.players.append(player)
-        print(f"Welcome to the Black Clover MUD, {player.name}! You are a {player.magic_type} mage.")
+        password_hash = yield from self.hashing(self.hasher.hash, password)
+        # The name may have been taken by another session while hashing
+        if name in self.players:
+            say("Username already taken. Please choose a different name.")
+            return False
+        player = Player(name, magic_type.capitalize(), password_hash)
+        player.inventory = dict(self.content.starting_inventory)
+        self.players.add(player)
+        self.player_changed(player)
+        say(f"Welcome to the Black Clover MUD, {player.name}! You are a {player.magic_type} mage.")
         return True
 
     # -------- Login -------- #
     def login_player(self, entered_name, entered_password):
-        for player in self.players:
-            if player.name.lower() == entered_name.lower():
-                if player.login(entered_password):
-                    print(f"Welcome back, {player.name}!")
-                    return player
-                else:
-                    print("Incorrect password. Please try again.")
-                    return None
-        print("Player not found.")
-        return None
+        """Generator (see hashing) returning the player, or None if login failed."""
+        player = yield from self.fetching_player(entered_name)
+        if player is None:
+            METRICS.inc('mud_logins_total', LOGIN_LABELS['unknown_player'])
+            say("Player not found.")
+            return None
+        stored = player.password
+        if not (yield from self.hashing(self.hasher.verify, entered_password, stored)):
+            METRICS.inc('mud_logins_total', LOGIN_LABELS['wrong_password'])
+            note_denied()
+            say("Incorrect password. Please try again.")
+            return None
+        METRICS.inc('mud_logins_total', LOGIN_LABELS['ok'])
+        if self.hasher.needs_rehash(stored):
+            # Plaintext records, and hashes made at another cost, are
+            # replaced now that the password is known.
+            player.password = yield from self.hashing(self.hasher.hash, entered_password)
+            self.player_changed(player)
+        note_player(LOGIN, player)
+        say(f"Welcome back, {player.name}!")
+        return player
+
+    # -------- Content -------- #
+    def reload_content(self, force=False):
+        """Load the content file again if it changed; returns whether it did.
+
+        Fights already under way keep the content they started with. If the
+        new file is invalid it is reported and the current content stays.
+        """
+        if not (force or self.content_file.changed()):
+            return False
+        try:
+            self.content = self.content_file.load()
+        except (OSError, ContentError) as e:
+            print(f"Content not reloaded: {e}")
+            return False
+        seed_codes(self.content)
+        return True
+
+    def magic_type_prompt(self):
+        return f"Choose your magic type ({', '.join(self.content.magic_types)}): "
 
     # -------- Default Spell Lookup -------- #
     def get_default_spell(self, player):
-        default_spells = {
-            "Fire": {"name": "Fireball", "cost": 10, "damage_range": (15, 25)},
-            "Water": {"name": "Water Jet", "cost": 10, "damage_range": (12, 22)},
-            "Wind": {"name": "Wind Slash", "cost": 8, "damage_range": (10, 20)},
-            "Earth": {"name": "Rock Smash", "cost": 12, "damage_range": (14, 24)},
-            "Lightning": {"name": "Lightning Strike", "cost": 10, "damage_range": (15, 25)}
-        }
-        return default_spells.get(player.magic_type, None)
+        return self.content.spells.get(player.magic_type)
 
     # -------- Interactive Turn-Based Battle -------- #
-    def battle(self, player):
-        level_index = 0
-        while level_index < len(self.levels):
-            level = self.levels[level_index]
-            print(f"\n{Color.BOLD}{player.name}, you are entering the {level} level battle in the {player.kingdom} kingdom!{Color.RESET}")
-            # Restore player's HP and mana at the start of each level
-            player.hp = player.max_hp
-            player.mana = player.max_mana
-
-            # Generate enemy based on level
-            enemy_hp = 20 + level_index * 10
-            enemy_attack_min = 5 + level_index
-            enemy_attack_max = 10 + level_index
-            enemy_name = random.choice(["Goblin", "Dark Mage", "Imp", "Demon Servant"])
-            enemy = {"name": enemy_name, "hp": enemy_hp, "attack_min": enemy_attack_min, "attack_max": enemy_attack_max}
-            print(f"A wild {enemy['name']} appears with {enemy['hp']} HP!")
-
-            defended = False  # Flag for defending this turn
-
-            # Battle loop for the current level
-            while enemy["hp"] > 0 and player.hp > 0:
-                print(f"\n{Color.CYAN}{player.name}'s HP: {player.hp}/{player.max_hp} | Mana: {player.mana}/{player.max_mana}{Color.RESET}")
-                print(f"{Color.MAGENTA}{enemy['name']}'s HP: {enemy['hp']}{Color.RESET}")
-                print("Choose your action:")
-                print("1. Attack")
-                print("2. Cast Spell")
-                print("3. Defend")
-                print("4. Use Item")
-                print("5. Flee")
-
-                action = input(Color.YELLOW + "Enter action (1-5): " + Color.RESET).strip()
-
-                if action == '1':
-                    # Normal attack
-                    damage = random.randint(5, 10) + player.level
-                    enemy["hp"] -= damage
-                    print(f"You attack and deal {damage} damage!")
-                elif action == '2':
-                    # Cast spell using default spell for player's magic type
-                    spell = self.get_default_spell(player)
-                    if spell:
-                        damage = player.cast_spell(spell)
-                        enemy["hp"] -= damage
-                    else:
-                        print("No default spell available for your magic type.")
-                elif action == '3':
-                    # Defend (reduces damage on enemy attack)
-                    defended = True
-                    print("You brace yourself to reduce incoming damage.")
-                elif action == '4':
-                    # Use item from inventory
-                    if player.inventory:
-                        print("Inventory:")
+    def battle(self, player, rng=random):
+        # Every fight sets the player's HP and mana, whatever its outcome
+        # (and even if the session ends mid-fight), so the final state is
+        # queued for the autosave once the battle is over.
+        try:
+            level_index = 0
+            while level_index < len(self.levels):
+                level = self.levels[level_index]
+                say(f"\n{Color.BOLD}{player.name}, you are entering the {level} level battle in the {player.kingdom} kingdom!{Color.RESET}")
+                # The fight restores the player's HP and mana and rolls an enemy
+                # scaled to the level (see mud_battle for the rules)
+                fight = Fight(player, level_index, rng, self.get_default_spell(player), content=self.content)
+                METRICS.inc('mud_battles_total')
+                enemy = fight.enemy
+                say(f"A wild {enemy['name']} appears with {enemy['hp']} HP!")
+
+                # Battle loop for the current level
+                while fight.outcome is None:
+                    say(f"\n{Color.CYAN}{player.name}'s HP: {player.hp}/{player.max_hp} | Mana: {player.mana}/{player.max_mana}{Color.RESET}")
+                    say(f"{Color.MAGENTA}{enemy['name']}'s HP: {enemy['hp']}{Color.RESET}")
+                    say(BATTLE_ACTIONS_MENU, end='')
+
+                    action = (yield Color.YELLOW + "Enter action (1-5): " + Color.RESET).strip()
+                    action = ACTIONS.get(action)
+                    if action is None:
+                        say("Invalid action. Try again.")
+                        continue
+
+                    item_choice = None
+                    if action == 'item' and player.inventory:
+                        say("Inventory:")
                         for item, count in player.inventory.items():
-                            print(f"- {item}: {count}")
-                        item_choice = input("Enter the item name to use: ").strip()
-                        if item_choice in player.inventory and player.inventory[item_choice] > 0:
-                            if item_choice.lower() == "health potion":
-                                heal = 30
-                                player.hp = min(player.hp + heal, player.max_hp)
-                                print(f"You used a Health Potion and recovered {heal} HP!")
-                            elif item_choice.lower() == "mana potion":
-                                restore = 20
-                                player.mana = min(player.mana + restore, player.max_mana)
-                                print(f"You used a Mana Potion and restored {restore} mana!")
-                            else:
-                                print("Item has no effect.")
-                            player.inventory[item_choice] -= 1
-                        else:
-                            print("You don't have that item.")
+                            say(f"- {item}: {count}")
+                        item_choice = (yield "Enter the item name to use: ").strip()
+
+                    if self.world is not None:
+                        # On a server the turn is resolved on the world's next tick
+                        events = yield self.world.queue_turn(fight, action, item_choice)
                     else:
-                        print("Your inventory is empty.")
-                elif action == '5':
-                    # Attempt to flee (50% chance)
-                    if random.random() < 0.5:
-                        print("You managed to flee from the battle!")
+                        with METRICS.span('mud_battle_turn_seconds'):
+                            events = fight.take_turn(action, item_choice)
+                    self.describe_player_turn(player, fight, events[0])
+                    if fight.outcome is not None:
+                        METRICS.inc('mud_battles_finished_total', OUTCOME_LABELS[fight.outcome])
+
+                    if fight.outcome == 'fled':
                         return  # Exit battle (counts as a loss)
-                    else:
-                        print("Flee attempt failed!")
-                else:
-                    print("Invalid action. Try again.")
-                    continue
-
-                # Check if enemy is defeated
-                if enemy["hp"] <= 0:
-                    print(Color.BOLD + Color.GREEN + f"You defeated the {enemy['name']}!" + Color.RESET)
-                    if level == 'Elite':
-                        sword_award = self.get_sword_award(player.kingdom)
-                        print(f"Congratulations, {player.name}! You've conquered the {player.kingdom} kingdom and earned a {sword_award}!")
-                        player.sword_awards.append(sword_award)
-                        player.kingdoms_won.append(player.kingdom)
-                        if set(player.sword_awards) == {'Demon Slayer', 'Demon Dweller', 'Demon Destroyer', 'Demon-Majestic'}:
-                            print(f"Congratulations, {player.name}! You are now the Wizard King!")
-                    player.level_up()
-                    break
-
-                # Enemy's turn to attack if still alive
-                enemy_damage = random.randint(enemy["attack_min"], enemy["attack_max"])
-                if defended:
-                    enemy_damage = enemy_damage // 2
-                    print("Your defense reduces the incoming damage!")
-                    defended = False  # Reset defend flag
-                player.hp -= enemy_damage
-                print(f"{enemy['name']} attacks and deals {enemy_damage} damage!")
-
-                # Check if player is defeated
+
+                    # Check if enemy is defeated
+                    if fight.outcome == 'won':
+                        say(Color.BOLD + Color.GREEN + f"You defeated the {enemy['name']}!" + Color.RESET)
+                        if level == 'Elite':
+                            sword_award = self.get_sword_award(player.kingdom)
+                            say(f"Congratulations, {player.name}! You've conquered the {player.kingdom} kingdom and earned a {sword_award}!")
+                            player.win_kingdom(player.kingdom, sword_award)
+                            if player.is_wizard_king(self.content.swords.values()):
+                                say(f"Congratulations, {player.name}! You are now the Wizard King!")
+                        player.level_up()
+                        say(f"{player.name} leveled up to level {player.level}!")
+                        self.players.reindex(player)
+                        self.player_changed(player)
+                        break
+
+                    # Enemy's turn to attack if still alive
+                    _, enemy_damage, defended = events[1]
+                    if defended:
+                        say("Your defense reduces the incoming damage!")
+                    say(f"{enemy['name']} attacks and deals {enemy_damage} damage!")
+
+                    # Check if player is defeated
+                    if fight.outcome == 'lost':
+                        say(Color.BOLD + Color.RED + "You have been defeated!" + Color.RESET)
+                        # Offer restart or repeat option
+                        while True:
+                            choice = (yield "Do you want to restart this level or repeat the previous one? (restart/repeat): ").lower()
+                            if choice == 'restart':
+                                break  # Restart current level (will reinitialize HP/mana)
+                            elif choice == 'repeat' and level_index > 0:
+                                level_index -= 1  # Go back to previous level
+                                break
+                            else:
+                                say("Invalid choice. Please enter 'restart' or 'repeat'.")
+                        break  # Exit the battle loop for this level
+
+                # If player was defeated, exit battle early
                 if player.hp <= 0:
-                    print(Color.BOLD + Color.RED + "You have been defeated!" + Color.RESET)
-                    # Offer restart or repeat option
-                    while True:
-                        choice = input("Do you want to restart this level or repeat the previous one? (restart/repeat): ").lower()
-                        if choice == 'restart':
-                            break  # Restart current level (will reinitialize HP/mana)
-                        elif choice == 'repeat' and level_index > 0:
-                            level_index -= 1  # Go back to previous level
-                            break
-                        else:
-                            print("Invalid choice. Please enter 'restart' or 'repeat'.")
-                    break  # Exit the battle loop for this level
+                    say("Recover and try again later...")
+                    return
 
-            # If player was defeated, exit battle early
-            if player.hp <= 0:
-                print("Recover and try again later...")
-                return
+                level_index += 1
+        finally:
+            self.player_changed(player)
 
-            level_index += 1
+    def describe_player_turn(self, player, fight, event):
+        kind = event[0]
+        if kind == 'attack':
+            say(f"You attack and deal {event[1]} damage!")
+        elif kind == 'spell':
+            say(f"{player.name} casts {fight.spell['name']} for {event[1]} damage (cost {fight.spell['cost']} mana)!")
+        elif kind == 'no_mana':
+            say("Not enough mana!")
+        elif kind == 'no_spell':
+            say("No default spell available for your magic type.")
+        elif kind == 'defend':
+            say("You brace yourself to reduce incoming damage.")
+        elif kind == 'empty_inventory':
+            say("Your inventory is empty.")
+        elif kind == 'item':
+            _, item, effect = event
+            if effect is None:
+                say("You don't have that item.")
+                return
+            self.player_changed(player)
+            if not effect:
+                say("Item has no effect.")
+            elif effect[0] == 'hp':
+                say(f"You used a {item} and recovered {effect[1]} HP!")
+            else:
+                say(f"You used a {item} and restored {effect[1]} mana!")
+        elif kind == 'fled':
+            say("You managed to flee from the battle!")
+        elif kind == 'flee_failed':
+            say("Flee attempt failed!")
 
     def get_sword_award(self, kingdom):
-        sword_rewards = {
-            'Clover': 'Demon Slayer',
-            'Diamond': 'Demon Dweller',
-            'Heart': 'Demon Destroyer',
-            'Spade': 'Demon-Majestic'
-        }
-        return sword_rewards.get(kingdom, 'Unknown Sword')
+        return self.content.swords.get(kingdom, 'Unknown Sword')
 
     # -------- Quest System -------- #
-    def quest(self, player):
-        print("\nA mysterious quest appears!")
-        print("You must retrieve a lost grimoire page from the cursed library.")
-        answer = input("Do you accept the quest? (yes/no): ").strip().lower()
+    def quest(self, player, rng=random):
+        say("\nA mysterious quest appears!")
+        say("You must retrieve a lost grimoire page from the cursed library.")
+        answer = (yield "Do you accept the quest? (yes/no): ").strip().lower()
         if answer == "yes":
-            print("You embark on the quest...")
+            say("You embark on the quest...")
             # Simulate quest challenge with a success chance
-            if random.random() < 0.7:
-                print(Color.GREEN + "Quest successful! You found the grimoire page." + Color.RESET)
-                player.experience += 50
-                print("You gained 50 experience points!")
+            if self.world is not None:
+                succeeded = yield self.world.queue_quest(player, rng)
+            else:
+                succeeded = attempt_quest(player, rng)
+            if succeeded:
+                say(Color.GREEN + "Quest successful! You found the grimoire page." + Color.RESET)
+                self.player_changed(player)
+                say(f"You gained {DEFAULT_TUNING['quest_experience']} experience points!")
             else:
-                print(Color.RED + "Quest failed. Better luck next time." + Color.RESET)
+                say(Color.RED + "Quest failed. Better luck next time." + Color.RESET)
         else:
-            print("You declined the quest.")
+            say("You declined the quest.")
 
     # -------- Saving & Loading -------- #
     def save_game(self, player):
-        with open(os.path.join(self.data_folder, f"{player.name}_save.json"), 'w') as file:
-            json.dump(player.to_dict(), file)
-        print(Color.BOLD + Color.GREEN + "Game saved successfully." + Color.RESET)
+        with METRICS.span('mud_save_seconds', SAVE_PLAYER_LABEL):
+            self.store.save_player(player)
+        say(Color.BOLD + Color.GREEN + "Game saved successfully." + Color.RESET)
 
     def load_game(self, player_name):
-        existing_player = next((p for p in self.players if p.name.lower() == player_name.lower()), None)
+        """Generator (see reading) returning the loaded player, or None."""
+        existing_player = yield from self.fetching_player(player_name)
         if existing_player:
-            print(f"Player {player_name} is already loaded.")
+            note_player(LOAD, existing_player)
+            say(f"Player {player_name} is already loaded.")
             return existing_player
-        try:
-            with open(os.path.join(self.data_folder, f"{player_name}_save.json"), 'r') as file:
-                data = json.load(file)
-                player = Player.from_dict(data)
-                self.players.append(player)
-                print(f"Game loaded successfully for {player_name}.")
-                return player
-        except FileNotFoundError:
-            print(f"No saved game found for {player_name}.")
-        return None
+        with METRICS.span('mud_load_seconds', SAVE_PLAYER_LABEL):
+            data = yield from self.reading(self.store.load_player, player_name)
+        if data is None:
+            say(f"No saved game found for {player_name}.")
+            return None
+        player = Player.from_dict(data)
+        self.players.add(player)
+        note_player(LOAD, player)
+        say(f"Game loaded successfully for {player_name}.")
+        return player
 
     def save_players_data(self):
-        data = [player.to_dict() for player in self.players]
-        with open(os.path.join(self.data_folder, 'players_data.json'), 'w') as file:
-            json.dump(data, file)
-        print("Players' data saved successfully.")
+        """Write every changed player; blocks on the autosave's I/O, so never call it on an event loop."""
+        if self.autosave is not None:
+            # Written in order behind what the autosave already holds
+            for player in self.players.dirty_players():
+                self.autosave.note(player)
+            self.autosave.flush()
+        # Only players changed since the last save are written.
+        changed = self.players.dirty_players()
+        with METRICS.span('mud_save_seconds', SAVE_ROSTER_LABEL):
+            self.store.save_players(changed, self.players)
+        for player in changed:
+            player.dirty = False
+        say("Players' data saved successfully.")
+
+    def write_snapshot(self):
+        """Mirror the roster in the store's snapshot file for the next start; call after save_players_data."""
+        if self.store.snapshot_path is None or self.cache_size:
+            return
+        try:
+            with METRICS.span('mud_save_seconds', SNAPSHOT_LABEL):
+                write_player_snapshot(self.store.snapshot_path, self.players.snapshot_entries(),
+                                      self.store.fingerprint())
+        except (OSError, OverflowError) as e:
+            # Only costs a slower next start: it will load from the store.
+            # OverflowError: a level too large for its u32 column.
+            say(f"Could not write the players' snapshot: {e}")
 
     def load_players_data(self):
         try:
-            with open(os.path.join(self.data_folder, 'players_data.json'), 'r') as file:
-                data = json.load(file)
-                self.players = [Player.from_dict(player_data) for player_data in data]
-        except FileNotFoundError:
-            pass
+            with METRICS.span('mud_load_seconds', SAVE_ROSTER_LABEL):
+                if self.cache_size:
+                    self.players = LazyPlayerRegistry(self.store, self.cache_size, self.autosave)
+                    return
+                snapshot = None
+                if self.store.snapshot_path is not None:
+                    # None when missing or stale: the store changed after it was written
+                    snapshot = PlayerSnapshot.open(self.store.snapshot_path, self.store.fingerprint())
+                if snapshot is not None:
+                    self.players = SnapshotRegistry(snapshot)
+                else:
+                    data = self.store.load_players()
+                    self.players = PlayerRegistry(Player.from_record(record) for record in data)
         except Exception as e:
-            print(f"An error occurred while loading players' data: {e}")
+            say(f"An error occurred while loading players' data: {e}")
 
     # -------- Other Utilities -------- #
+    def add_metrics(self):
+        """Gauges for what this game holds, read on each metrics scrape."""
+        METRICS.add(Gauge('mud_players', "Players in the roster (known players when loading on demand).",
+                          lambda: len(self.players)))
+        METRICS.add(Gauge('mud_players_loaded', "Players held in memory.",
+                          lambda: self.players.stats()['loaded']))
+
     def list_players(self):
-        print("Current Players:")
-        for player in self.players:
-            print(f"- {player.name}, {player.magic_type} mage")
-
-    def display_leaderboard(self):
-        sorted_players = sorted(self.players, key=lambda x: (len(x.sword_awards), x.level), reverse=True)
-        print("\nLeaderboard:")
-        for i, player in enumerate(sorted_players, start=1):
+        """Generator (see reading), so a sharded game can read other shards' players on demand."""
+        say("Current Players:")
+        for name, magic_type in self.players.summaries():
+            say(f"- {name}, {magic_type} mage")
+        yield from ()
+
+    def display_leaderboard(self, limit=None, offset=0, viewer=None):
+        leaderboard = self.players.leaderboard
+        say("\nLeaderboard:")
+        for i, player in enumerate(self.players.leaderboard_page(offset, limit), start=offset + 1):
             swords_earned = ', '.join(player.sword_awards) if player.sword_awards else 'None'
             kingdoms_won = ', '.join(player.kingdoms_won) if player.kingdoms_won else 'None'
-            print(f"{i}. {player.name} - Level: {player.level}, Swords: {swords_earned}, Kingdoms Conquered: {kingdoms_won}")
+            say(f"{i}. {player.name} - Level: {player.level}, Swords: {swords_earned}, Kingdoms Conquered: {kingdoms_won}")
+        if limit is not None and len(leaderboard) > offset + limit:
+            say(f"... {len(leaderboard) - offset - limit} more players")
+        if viewer is not None:
+            rank = leaderboard.rank_of(self.players.key(viewer.name))
+            if rank is not None:
+                say(f"Your rank: {rank} of {len(leaderboard)}")
 
     def delete_player_data(self, player_name):
-        player_to_delete = next((p for p in self.players if p.name.lower() == player_name.lower()), None)
+        """Generator (see reading)."""
+        player_to_delete = yield from self.fetching_player(player_name)
         if player_to_delete:
             self.players.remove(player_to_delete)
-            save_file_path = os.path.join(self.data_folder, f"{player_name}_save.json")
-            if os.path.exists(save_file_path):
-                os.remove(save_file_path)
-            print(f"Player data for {player_name} deleted successfully.")
+            if self.autosave is not None:
+                self.autosave.discard(player_to_delete.name)
+            self.store.delete_player(player_to_delete.name)
+            say(f"Player data for {player_name} deleted successfully.")
         else:
-            print(f"No player found with the name {player_name}.")
+            say(f"No player found with the name {player_name}.")
 
     # -------- Main Game Loop -------- #
-    def start_game(self):
+    # The interactive parts of the game (main_menu, battle, quest) are
+    # generators: they yield each prompt and are sent back the reply. The
+    # console drives them with input() in play(); mud_server drives the same
+    # flows from network sessions.
+    def show_intro(self):
+        if self.intro is None:
+            intro = ASCII_ART + "\n" + Color.BOLD + Color.GREEN + STORY_TEXT + Color.RESET + "\n"
+            if os.path.exists('welcome.txt'):
+                with open('welcome.txt', 'r') as file:
+                    welcome_message = file.read()
+                    intro += Color.BOLD + Color.GREEN + welcome_message + Color.RESET + "\n"
+            self.intro = intro
+        say(self.intro, end='')
+
+    def play(self, flow, color=None):
+        screen = ScreenBuffer(self._write_console, use_color() if color is None else color)
+        token = current_output.set(screen)
+        try:
+            prompt = next(flow)
+            while True:
+                screen.flush(prompt)
+                prompt = flow.send(input())
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            screen.flush()
+            current_output.reset(token)
+
+    @staticmethod
+    def _write_console(text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    def start_game(self, color=None, seed=None, log_folder=None):
         self.load_players_data()
-        display_ascii_art()
-        print(Color.BOLD + Color.GREEN + STORY_TEXT + Color.RESET)
+        seed = new_seed() if seed is None else seed
+        flow = self.intro_and_menu(random.Random(seed))
+        log = ActionLog.create(log_folder, seed) if log_folder else None
+        try:
+            self.play(recorded(flow, log) if log else flow, color)
+            # Exit saved the roster; on a server, serve() does this at shutdown
+            # instead, since every session's Exit would rewrite the whole file.
+            self.write_snapshot()
+        finally:
+            if log:
+                log.close()
+            if self.autosave is not None:
+                # Also on Ctrl-C or a closed stdin: keep what was already noted
+                self.autosave.close()
 
-        if os.path.exists('welcome.txt'):
-            with open('welcome.txt', 'r') as file:
-                welcome_message = file.read()
-                print(Color.BOLD + Color.GREEN + welcome_message + Color.RESET)
+    def intro_and_menu(self, rng=random):
+        self.show_intro()
+        return (yield from self.main_menu(rng))
 
+    def main_menu(self, rng=random):
+        # All of a session's battle and quest rolls come from rng, so a
+        # session seeds it once and can be replayed (see mud_replay).
         active_player = None
 
         while True:
-            print("\n" + Color.BOLD + "MAIN MENU" + Color.RESET)
-            print("1. " + Color.BLUE + "Create a new player" + Color.RESET)
-            print("2. " + Color.BLUE + "Log in" + Color.RESET)
-            print("3. " + Color.BLUE + "Choose Kingdom (for active player)" + Color.RESET)
-            print("4. " + Color.BLUE + "List players" + Color.RESET)
-            print("5. " + Color.BLUE + "Leaderboard" + Color.RESET)
-            print("6. " + Color.BLUE + "Save Game (active player)" + Color.RESET)
-            print("7. " + Color.BLUE + "Load Game" + Color.RESET)
-            print("8. " + Color.BLUE + "Delete Player Data" + Color.RESET)
-            print("9. " + Color.BLUE + "Embark on a Quest" + Color.RESET)
-            print("10. " + Color.RED + "Exit" + Color.RESET)
-
-            choice = input(Color.YELLOW + "Enter your choice: " + Color.RESET).strip()
+            say(MAIN_MENU, end='')
+
+            choice = (yield Color.YELLOW + "Enter your choice: " + Color.RESET).strip()
+            METRICS.inc('mud_menu_choices_total', MENU_LABELS.get(choice, INVALID_MENU_LABEL))
 
             if choice == '1':
-                name = input("Enter your name: ").strip()
-                magic_type = input("Choose your magic type (Fire, Water, Wind, Earth, Lightning): ").strip()
-                password = input("Enter your password: ").strip()
-                created = self.create_player(name, magic_type, password)
+                name = (yield "Enter your name: ").strip()
+                magic_type = (yield self.magic_type_prompt()).strip()
+                password = (yield Secret("Enter your password: ")).strip()
+                created = yield from self.create_player(name, magic_type, password)
                 if created:
-                    active_player = next((p for p in self.players if p.name.lower() == name.lower()), None)
+                    active_player = self.players.get(name)
 
             elif choice == '2':
                 while True:
-                    entered_name = input("Enter your name (or type 'back' to return): ").strip()
+                    entered_name = (yield "Enter your name (or type 'back' to return): ").strip()
                     if entered_name.lower() == 'back':
                         break
-                    entered_password = input("Enter your password: ").strip()
-                    player = self.login_player(entered_name, entered_password)
+                    entered_password = (yield Secret("Enter your password: ")).strip()
+                    player = yield from self.login_player(entered_name, entered_password)
                     if player is None:
-                        retry_choice = input("Would you like to try again (T) or create a new character (N)? ").strip().lower()
+                        retry_choice = (yield "Would you like to try again (T) or create a new character (N)? ").strip().lower()
                         if retry_choice == 'n':
-                            name = input("Enter your name: ").strip()
-                            magic_type = input("Choose your magic type (Fire, Water, Wind, Earth, Lightning): ").strip()
-                            password = input("Enter your password: ").strip()
-                            created = self.create_player(name, magic_type, password)
+                            name = (yield "Enter your name: ").strip()
+                            magic_type = (yield self.magic_type_prompt()).strip()
+                            password = (yield Secret("Enter your password: ")).strip()
+                            created = yield from self.create_player(name, magic_type, password)
                             if created:
-                                active_player = next((p for p in self.players if p.name.lower() == name.lower()), None)
+                                active_player = self.players.get(name)
                                 break
                         else:
                             continue
@@ -448,64 +1371,97 @@ class BlackCloverMUD:
 
             elif choice == '3':
                 if not active_player:
-                    print("No active player. Please create or log in first.")
+                    say("No active player. Please create or log in first.")
                 else:
                     # Let the active player choose a kingdom if not already conquered
-                    print("\nChoose the kingdom you want to battle in:")
-                    available_kingdoms = [kingdom for kingdom in ["Clover", "Diamond", "Heart", "Spade"]
-                                          if kingdom not in active_player.kingdoms_won]
+                    say("\nChoose the kingdom you want to battle in:")
+                    available_kingdoms = [kingdom for kingdom in self.content.kingdoms
+                                          if not active_player.has_won(kingdom)]
                     if not available_kingdoms:
-                        print("You have already won all kingdoms. There are no more battles.")
+                        say("You have already won all kingdoms. There are no more battles.")
                     else:
                         for idx, kingdom in enumerate(available_kingdoms, 1):
-                            print(f"{idx}. {kingdom}")
-                        choice_kingdom = input(f"Enter your choice (1-{len(available_kingdoms)}): ").strip()
+                            say(f"{idx}. {kingdom}")
+                        choice_kingdom = (yield f"Enter your choice (1-{len(available_kingdoms)}): ").strip()
                         if choice_kingdom.isdigit() and 1 <= int(choice_kingdom) <= len(available_kingdoms):
                             selected_kingdom = available_kingdoms[int(choice_kingdom) - 1]
                             active_player.kingdom = selected_kingdom
-                            print(f"{active_player.name}, you have chosen the {selected_kingdom} kingdom for battle!")
-                            self.battle(active_player)
+                            self.player_changed(active_player)
+                            say(f"{active_player.name}, you have chosen the {selected_kingdom} kingdom for battle!")
+                            yield from self.battle(active_player, rng)
+                            note_player(CHECK, active_player)
                         else:
-                            print("Invalid kingdom choice.")
+                            say("Invalid kingdom choice.")
 
             elif choice == '4':
-                self.list_players()
+                yield from self.list_players()
 
             elif choice == '5':
-                self.display_leaderboard()
+                if self.read_pool is not None:
+                    # The page's players are read ahead, off the event loop
+                    for key in self.players.leaderboard.page(0, 10):
+                        yield from self.fetching_player(key)
+                self.display_leaderboard(limit=10, viewer=active_player)
 
             elif choice == '6':
                 if not active_player:
-                    print("No active player. Please create or log in first.")
+                    say("No active player. Please create or log in first.")
                 else:
                     self.save_game(active_player)
 
             elif choice == '7':
-                player_name = input("Enter your name to load the game: ").strip()
-                loaded_player = self.load_game(player_name)
+                player_name = (yield "Enter your name to load the game: ").strip()
+                loaded_player = yield from self.load_game(player_name)
                 if loaded_player:
                     active_player = loaded_player
 
             elif choice == '8':
-                player_name = input("Enter the name of the player to delete: ").strip()
-                self.delete_player_data(player_name)
+                player_name = (yield "Enter the name of the player to delete: ").strip()
+                yield from self.delete_player_data(player_name)
 
             elif choice == '9':
                 if not active_player:
-                    print("No active player. Please create or log in first.")
+                    say("No active player. Please create or log in first.")
                 else:
-                    self.quest(active_player)
+                    yield from self.quest(active_player, rng)
+                    note_player(CHECK, active_player)
 
             elif choice == '10':
-                self.save_players_data()
-                print("Thanks for playing! Goodbye.")
+                if self.world is None:
+                    self.save_players_data()
+                elif active_player is not None and active_player.dirty and self.autosave is not None:
+                    # A server saves the whole roster at shutdown; saving it
+                    # here would stall every session, so only this player is
+                    # queued for the autosave.
+                    self.autosave.note(active_player)
+                say("Thanks for playing! Goodbye.")
                 break
 
             else:
-                print(Color.RED + "Invalid choice. Please try again." + Color.RESET)
+                say(Color.RED + "Invalid choice. Please try again." + Color.RESET)
 
 
 # ------------------ Main Execution ------------------ #
 if __name__ == "__main__":
-    game = BlackCloverMUD()
-    game.start_game()
+    parser = argparse.ArgumentParser(description="Play Black Clover MUD in the console.")
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default='json')
+    parser.add_argument('--cache-size', type=int, default=None,
+                        help="Load players on demand, keeping at most this many in memory (sqlite only).")
+    parser.add_argument('--no-color', action='store_true', help="Print without ANSI colors.")
+    parser.add_argument('--content', default=CONTENT_FILE, help="Spells, enemies, kingdoms and items (JSON).")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for battle and quest rolls (default: random).")
+    parser.add_argument('--action-log', metavar='DIR', help="Record the session here for mud_replay.py.")
+    parser.add_argument('--metrics', metavar='ADDRESS',
+                        help="Serve Prometheus metrics and /profile on HOST:PORT or a Unix socket path.")
+    add_cost_arguments(parser)
+    add_autosave_arguments(parser)
+    args = parser.parse_args()
+    if args.cache_size and args.storage != 'sqlite':
+        parser.error("--cache-size needs --storage sqlite")
+    store = open_store(args.storage, BlackCloverMUD.data_folder)
+    game = BlackCloverMUD(store, cache_size=args.cache_size, hasher=PasswordHasher(cost_from_args(args)),
+                          content_path=args.content, autosave=autosaver_from_args(args, store))
+    if args.metrics:
+        serve_metrics(args.metrics)
+        game.add_metrics()
+    game.start_game(color=False if args.no_color else None, seed=args.seed, log_folder=args.action_log)
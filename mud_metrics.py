@@ -0,0 +1,251 @@
+"""Counters, timing histograms and a sampling profiler for a running game.
+
+Instrumented code calls METRICS.inc(), METRICS.observe() or uses
+`with METRICS.span(name):`. Until something enables METRICS (the --metrics
+option of the console or the server) those calls only test a flag, and
+span() returns a shared no-op context, so the instrumentation can stay in
+hot paths.
+
+serve_metrics() exposes the metrics in the Prometheus text format on a
+local TCP port or a Unix socket, from a background thread:
+
+    GET /metrics             every metric
+    GET /profile?seconds=N   sample the game thread's stack for N seconds
+                             and return collapsed stacks (one
+                             "outer;inner count" line per stack, the input
+                             flamegraph tools expect)
+"""
+import bisect
+import collections
+import contextlib
+import http.server
+import os
+import socketserver
+import sys
+import threading
+import time
+import urllib.parse
+
+# Seconds; suits anything from a battle turn to a full roster save.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+NO_SPAN = contextlib.nullcontext()
+
+
+def _labels_text(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+
+    def inc(self, labels=(), amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        # Copied first: the game thread may add labels while this renders.
+        for labels, value in list(self.values.items()):
+            yield self.name + _labels_text(labels), value
+
+
+class Gauge:
+    """A value read when metrics are collected, from func()."""
+    kind = 'gauge'
+
+    def __init__(self, name, help, func):
+        self.name = name
+        self.help = help
+        self.func = func
+
+    def samples(self):
+        yield self.name, self.func()
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values = {}    # labels -> [per-bucket counts (+ overflow), sum, count]
+
+    def observe(self, value, labels=()):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self):
+        for labels, (counts, total, count) in list(self.values.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                yield self.name + '_bucket' + _labels_text(labels, (('le', bound),)), cumulative
+            yield self.name + '_bucket' + _labels_text(labels, (('le', '+Inf'),)), count
+            yield self.name + '_sum' + _labels_text(labels), total
+            yield self.name + '_count' + _labels_text(labels), count
+
+
+class Span:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, self.labels)
+        return False
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.metrics = {}
+
+    def add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def inc(self, name, labels=(), amount=1):
+        if self.enabled:
+            self.metrics[name].inc(labels, amount)
+
+    def observe(self, name, value, labels=()):
+        if self.enabled:
+            self.metrics[name].observe(value, labels)
+
+    def span(self, name, labels=()):
+        """Time a block into histogram `name`; a no-op while disabled."""
+        if not self.enabled:
+            return NO_SPAN
+        return Span(self.metrics[name], labels)
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample, value in metric.samples():
+                lines.append(f"{sample} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+METRICS.add(Counter('mud_menu_choices_total', "Main menu choices made, by option."))
+METRICS.add(Counter('mud_logins_total', "Login attempts, by result."))
+METRICS.add(Counter('mud_battles_total', "Battle levels started."))
+METRICS.add(Counter('mud_battles_finished_total', "Battle levels finished, by outcome."))
+METRICS.add(Histogram('mud_battle_turn_seconds', "Time to resolve one battle turn in the session."))
+METRICS.add(Histogram('mud_world_tick_seconds', "Time to resolve one world tick."))
+METRICS.add(Histogram('mud_save_seconds', "Time to save, by what was saved."))
+METRICS.add(Histogram('mud_load_seconds', "Time to load, by what was loaded."))
+METRICS.add(Histogram('mud_json_seconds', "Time spent encoding or decoding player JSON, by operation."))
+METRICS.add(Counter('mud_autosaved_players_total', "Players written by the write-behind autosave."))
+METRICS.add(Counter('mud_autosave_failures_total', "Autosave batches that failed to write."))
+
+
+# ------------------ Sampling Profiler ------------------ #
+class SamplingProfiler:
+    """Counts the stacks one thread is in, sampled every `interval` seconds.
+
+    Sampling from a separate thread costs the game nothing between samples,
+    unlike cProfile, which slows every call.
+    """
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.main_thread().ident
+        self.interval = interval
+        self.stacks = collections.Counter()
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        if names:
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def run(self, seconds):
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            self.sample()
+            time.sleep(self.interval)
+        return self.collapsed()
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+# ------------------ Endpoint ------------------ #
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    max_profile_seconds = 60
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/metrics':
+            self.reply(200, METRICS.render(), 'text/plain; version=0.0.4')
+        elif url.path == '/profile':
+            query = urllib.parse.parse_qs(url.query)
+            try:
+                seconds = min(float(query.get('seconds', ['10'])[0]), self.max_profile_seconds)
+            except ValueError:
+                self.reply(400, "seconds must be a number\n")
+                return
+            self.reply(200, SamplingProfiler().run(seconds))
+        else:
+            self.reply(404, "Not found\n")
+
+    def reply(self, status, body, content_type='text/plain'):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else 'local'
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('local', 0)
+
+
+def serve_metrics(address):
+    """Enable METRICS and serve them on 'host:port' or a Unix socket path; returns the server."""
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        server = http.server.ThreadingHTTPServer((host or '127.0.0.1', int(port)), MetricsHandler)
+    else:
+        if os.path.exists(address):
+            os.remove(address)
+        server = _UnixHTTPServer(address, MetricsHandler)
+    METRICS.enabled = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
@@ -0,0 +1,188 @@
+"""Replay recorded sessions headlessly and report where they diverge.
+
+Sessions recorded with --action-log (console or server) are played again
+from their seed and input against the current rules and content, with no
+output, no disk writes and no password hashing, as fast as the CPU allows.
+After every battle and quest the player's state is compared with the one
+recorded live; the first difference marks the session as diverged.
+
+Replaying real sessions after changing mud_battle or content.json shows
+which recorded play the change would have turned out differently:
+
+    python mud_replay.py logs/*.mudlog
+    python mud_replay.py logs/ --content balance_test.json --workers 8
+
+The exit status is 1 if any session diverged or failed to replay.
+"""
+import argparse
+import concurrent.futures
+import os
+import random
+import sys
+import time
+
+from mud_actionlog import CHECK, DENIED, INPUT, LOAD, LOGIN, SECRET, current_log, player_state, read_log
+from mud_auth import PasswordHasher
+from mud_content import CONTENT_FILE
+from mud_game import BlackCloverMUD, Player, current_output
+from mud_storage import MemoryStore
+
+
+class ReplayHasher(PasswordHasher):
+    """Passwords are not in the log, so nothing is hashed and logins succeed unless the log says they failed."""
+
+    def __init__(self):
+        super().__init__()
+        self.denied = False     # Set while replaying an input whose login was refused live
+
+    def hash(self, password):
+        return ""
+
+    def verify(self, password, stored):
+        return not self.denied
+
+    def needs_rehash(self, stored):
+        return False
+
+
+class ReplayGame(BlackCloverMUD):
+    def __init__(self, content_path=CONTENT_FILE):
+        super().__init__(MemoryStore(), hasher=ReplayHasher(), content_path=content_path)
+
+    def attach(self, kind, state):
+        """Put a player the live session took over where the game will look for it."""
+        player = Player.from_dict(dict(state, password=""))
+        if kind == LOGIN:
+            existing = self.players.get(player.name)
+            if existing is not None:
+                self.players.remove(existing)
+            self.players.add(player)
+        else:
+            self.store.save_player(player)
+
+
+class Checks:
+    """Stands in for the ActionLog during a replay, keeping the CHECK states."""
+
+    def __init__(self):
+        self.states = []
+
+    def player(self, kind, player):
+        if kind == CHECK:
+            self.states.append(player_state(player))
+
+    def denied(self):
+        pass
+
+
+def _discard(text):
+    pass
+
+
+def replay(data, content_path=CONTENT_FILE):
+    """Replay one log's bytes; returns (status, inputs replayed, detail)."""
+    seed, records = read_log(data)
+    game = ReplayGame(content_path)
+    checks = Checks()
+    expected = []
+    inputs = 0
+    output_token = current_output.set(_discard)
+    log_token = current_log.set(checks)
+    flow = game.main_menu(random.Random(seed))
+    try:
+        next(flow)
+        for index, (kind, value) in enumerate(records):
+            if kind == CHECK:
+                expected.append(value)
+                continue
+            if kind not in (INPUT, SECRET):
+                continue
+            # LOGIN/LOAD/DENIED records follow the input that caused them, but
+            # the player (or the refusal) has to be in place before that input
+            # is replayed.
+            game.hasher.denied = False
+            for later_kind, later_value in records[index + 1:]:
+                if later_kind in (INPUT, SECRET):
+                    break
+                if later_kind in (LOGIN, LOAD):
+                    game.attach(later_kind, later_value)
+                elif later_kind == DENIED:
+                    game.hasher.denied = True
+            inputs += 1
+            flow.send(value or "")
+    except StopIteration:
+        pass
+    finally:
+        flow.close()
+        current_log.reset(log_token)
+        current_output.reset(output_token)
+
+    for number, (live, replayed) in enumerate(zip(expected, checks.states), 1):
+        if live != replayed:
+            changed = sorted(key for key in live.keys() | replayed.keys() if live.get(key) != replayed.get(key))
+            return 'diverged', inputs, f"check {number} differs in {', '.join(changed)}"
+    if len(expected) != len(checks.states):
+        return 'diverged', inputs, f"{len(expected)} checks recorded, {len(checks.states)} replayed"
+    return 'match', inputs, ""
+
+
+def replay_files(paths, content_path=CONTENT_FILE):
+    results = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            results.append((path,) + replay(data, content_path))
+        except Exception as e:
+            results.append((path, 'error', 0, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def find_logs(paths):
+    logs = []
+    for path in paths:
+        if os.path.isdir(path):
+            logs.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.mudlog')))
+        else:
+            logs.append(path)
+    return logs
+
+
+def run_replays(logs, content_path, workers, chunk=200):
+    chunks = [logs[start:start + chunk] for start in range(0, len(logs), chunk)]
+    if workers <= 1:
+        for paths in chunks:
+            yield from replay_files(paths, content_path)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        for results in pool.map(replay_files, chunks, [content_path] * len(chunks)):
+            yield from results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded sessions and report any that play out differently.")
+    parser.add_argument('logs', nargs='+', help="Action log files, or folders of them.")
+    parser.add_argument('--content', default=CONTENT_FILE, help="Content to replay against.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--quiet', action='store_true', help="Only print the summary.")
+    args = parser.parse_args()
+
+    logs = find_logs(args.logs)
+    counts = {'match': 0, 'diverged': 0, 'error': 0}
+    inputs = 0
+    start = time.perf_counter()
+    for path, status, replayed, detail in run_replays(logs, args.content, args.workers):
+        counts[status] += 1
+        inputs += replayed
+        if status != 'match' and not args.quiet:
+            print(f"{status:<8} {path}: {detail}")
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(logs)} sessions, {inputs} inputs in {elapsed:.2f}s "
+          f"({inputs / elapsed if elapsed else 0:,.0f} inputs/s): "
+          f"{counts['match']} match, {counts['diverged']} diverged, {counts['error']} failed")
+    sys.exit(1 if counts['diverged'] or counts['error'] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+import argparse
+import asyncio
+import concurrent.futures
+import gc
+import os
+import random
+import re
+import signal
+
+from mud_actionlog import ActionLog, new_seed, recorded
+from mud_auth import PasswordHasher, add_cost_arguments, cost_from_args
+from mud_autosave import add_autosave_arguments, autosaver_from_args
+from mud_content import CONTENT_FILE
+from mud_game import BlackCloverMUD, ScreenBuffer, current_output, use_color
+from mud_metrics import METRICS, Gauge, serve_metrics
+from mud_storage import open_store
+from mud_world import World
+
+
+# ------------------ Telnet Line Handling ------------------ #
+# Telnet clients mix option negotiation (IAC ...) into the byte stream. We do
+# not negotiate anything, so those sequences are simply dropped from input.
+TELNET_COMMANDS = re.compile(rb'\xff\xfa.*?\xff\xf0|\xff[\xfb-\xfe].|\xff[\xf0-\xfa\xff]', re.DOTALL)
+
+
+def clean_line(raw):
+    return TELNET_COMMANDS.sub(b'', raw).decode('utf-8', errors='replace').strip('\r\n')
+
+
+# ------------------ Client Session ------------------ #
+class Session:
+    def __init__(self, game, reader, writer, idle_timeout=None, write_timeout=30.0, color=True,
+                 log_folder=None):
+        self.game = game
+        self.log_folder = log_folder
+        self.reader = reader
+        self.writer = writer
+        self.task = None        # The task serving this session, set by MUDServer
+        self.screen = ScreenBuffer(self.send, color)
+        self.idle_timeout = idle_timeout
+        self.write_timeout = write_timeout
+        self.peer = writer.get_extra_info('peername')
+
+    def send(self, text):
+        self.writer.write(text.replace('\n', '\r\n').encode('utf-8'))
+
+    async def flush(self, prompt=''):
+        # Everything said since the last prompt goes out as one write, then
+        # backpressure is applied once per prompt.
+        self.screen.flush(prompt)
+        await asyncio.wait_for(self.writer.drain(), self.write_timeout)
+
+    async def read_line(self):
+        try:
+            raw = await asyncio.wait_for(self.reader.readline(), self.idle_timeout)
+        except ValueError:
+            # Line longer than the reader limit: drop the client rather than
+            # buffering unbounded input.
+            return None
+        if not raw:
+            return None
+        return clean_line(raw)
+
+    async def run(self):
+        # Each connection runs in its own task, so setting the writer here
+        # only affects this client's output.
+        current_output.set(self.screen)
+        seed = new_seed()
+        flow = self.game.main_menu(random.Random(seed))
+        log = ActionLog.create(self.log_folder, seed) if self.log_folder else None
+        if log:
+            flow = recorded(flow, log)
+        try:
+            self.game.show_intro()
+            prompt = next(flow)
+            while True:
+                if asyncio.isfuture(prompt):
+                    # A battle turn or quest waiting for the world's tick
+                    await self.flush()
+                    prompt = flow.send(await prompt)
+                    continue
+                await self.flush(prompt)
+                line = await self.read_line()
+                if line is None:
+                    break
+                prompt = flow.send(line)
+        except StopIteration:
+            pass
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            flow.close()
+            if log:
+                log.close()
+            self.screen.flush()
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+# ------------------ Server ------------------ #
+class MUDServer:
+    def __init__(self, game, host='0.0.0.0', port=4000, max_sessions=10000,
+                 idle_timeout=None, max_line=1024, write_buffer=64 * 1024, tick_rate=10, color=True,
+                 content_poll=2.0, action_log=None):
+        self.game = game
+        self.action_log = action_log
+        self.content_poll = content_poll
+        self.color = color
+        self.world = World(tick_rate)
+        game.world = self.world
+        # Store reads run here, as many at once as the store serves
+        game.read_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=game.store.read_concurrency, thread_name_prefix='reader')
+        self.host = host
+        self.port = port
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_line = max_line
+        self.write_buffer = write_buffer
+        self.sessions = set()
+        self.closing = False    # Set at shutdown: no new sessions start
+        self.server = None
+        self.stopped = None     # Set to stop serving; created by serve()
+
+    async def handle_client(self, reader, writer):
+        if self.closing:
+            writer.close()
+            return
+        if len(self.sessions) >= self.max_sessions:
+            writer.write(b"Server is full. Please try again later.\r\n")
+            writer.close()
+            return
+        writer.transport.set_write_buffer_limits(high=self.write_buffer)
+        session = Session(self.game, reader, writer, idle_timeout=self.idle_timeout, color=self.color,
+                          log_folder=self.action_log)
+        session.task = asyncio.current_task()
+        self.sessions.add(session)
+        try:
+            await session.run()
+        except Exception as e:
+            print(f"Session {session.peer} ended with an error: {e}")
+        finally:
+            self.sessions.discard(session)
+
+    def add_metrics(self):
+        self.game.add_metrics()
+        METRICS.add(Gauge('mud_sessions_active', "Connected client sessions.", lambda: len(self.sessions)))
+        METRICS.add(Gauge('mud_battles_active', "Battles waiting on the world tick or their player.",
+                          lambda: self.world.active_battles))
+        METRICS.add(Gauge('mud_world_tick_overruns', "World ticks that took longer than the tick interval.",
+                          lambda: self.world.metrics.overruns))
+        METRICS.add(Gauge('mud_world_actions_carried', "Actions left for a later tick because a tick ran out of time.",
+                          lambda: self.world.metrics.carried))
+
+    async def listen(self):
+        self.server = await asyncio.start_server(
+            self.handle_client, self.host, self.port,
+            limit=self.max_line, backlog=1024)
+        print(f"Black Clover MUD listening on {self.host}:{self.port}")
+
+    async def stop_listening(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def background(self):
+        """Coroutines run alongside the world while serving; cancelled on shutdown."""
+        return [self.watch_content()]
+
+    async def serve(self):
+        self.game.load_players_data()
+        # The roster lives as long as the server. Frozen, it is left out of
+        # full collections, which would otherwise walk it mid-tick.
+        gc.freeze()
+        self.stopped = stop = asyncio.Event()
+        await self.listen()
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        try:
+            loop.add_signal_handler(signal.SIGHUP, self.reload_content, True)
+        except (AttributeError, NotImplementedError, RuntimeError):
+            pass
+
+        world_task = asyncio.create_task(self.world.run())
+        tasks = [asyncio.create_task(coroutine) for coroutine in self.background()]
+        await stop.wait()
+        await self.stop_listening()
+        await self.close_sessions()
+        self.world.stop()
+        for task in tasks:
+            task.cancel()
+        await world_task
+        self.game.hasher.close()
+        self.game.read_pool.shutdown()
+        # Waits on the autosave's I/O thread, so not on the event loop
+        await loop.run_in_executor(None, self.save_and_close)
+
+    async def close_sessions(self):
+        """End every session, closing its flow: a battle under way queues its player (see battle)."""
+        self.closing = True
+        for session in self.sessions:
+            # Read as the client hanging up once what it already sent is played
+            session.reader.feed_eof()
+        await asyncio.gather(*(session.task for session in list(self.sessions)), return_exceptions=True)
+
+    def save_and_close(self):
+        self.game.save_players_data()
+        self.game.write_snapshot()
+        if self.game.autosave is not None:
+            self.game.autosave.close()
+
+    def reload_content(self, force=False):
+        if self.game.reload_content(force):
+            print(f"Reloaded content from {self.game.content_file.path}")
+
+    async def watch_content(self):
+        # Edits to the content file take effect without a restart: new
+        # fights and menus use the reloaded tables.
+        while self.content_poll:
+            await asyncio.sleep(self.content_poll)
+            self.reload_content()
+
+
+def raise_open_file_limit():
+    # Every client is one socket; the default soft limit (often 1024) is too
+    # low for thousands of idle connections.
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+# ------------------ Main Execution ------------------ #
+def add_server_arguments(parser):
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=4000)
+    parser.add_argument('--max-sessions', type=int, default=10000)
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default='json')
+    parser.add_argument('--cache-size', type=int, default=None,
+                        help="Load players on demand, keeping at most this many in memory (sqlite only).")
+    parser.add_argument('--tick-rate', type=int, default=10,
+                        help="World ticks per second; battle turns resolve on the next tick.")
+    parser.add_argument('--hash-workers', type=int, default=min(4, os.cpu_count() or 1),
+                        help="Threads checking password hashes, so logins do not block the event loop.")
+    add_cost_arguments(parser)
+    add_autosave_arguments(parser)
+    parser.add_argument('--content', default=CONTENT_FILE,
+                        help="Spells, enemies, kingdoms and items (JSON); reloaded when it changes or on SIGHUP.")
+    parser.add_argument('--action-log', metavar='DIR',
+                        help="Record every session here (seed and input) for mud_replay.py.")
+    parser.add_argument('--metrics', metavar='ADDRESS',
+                        help="Serve Prometheus metrics and /profile on HOST:PORT or a Unix socket path.")
+    parser.add_argument('--no-color', action='store_true', help="Strip ANSI colors for plain clients.")
+    parser.add_argument('--idle-timeout', type=float, default=None,
+                        help="Disconnect clients idle for this many seconds (default: never).")
+
+
+def check_server_arguments(parser, args):
+    if args.cache_size and args.storage != 'sqlite':
+        parser.error("--cache-size needs --storage sqlite")
+
+
+def game_from_args(args, data_folder=BlackCloverMUD.data_folder, game_class=BlackCloverMUD, **kwargs):
+    hasher = PasswordHasher(cost_from_args(args), workers=max(1, args.hash_workers))
+    store = open_store(args.storage, data_folder)
+    return game_class(store, cache_size=args.cache_size, hasher=hasher, content_path=args.content,
+                      autosave=autosaver_from_args(args, store), **kwargs)
+
+
+def server_from_args(args, game, server_class=MUDServer, **kwargs):
+    return server_class(game, host=args.host, port=args.port,
+                        max_sessions=args.max_sessions, idle_timeout=args.idle_timeout,
+                        tick_rate=args.tick_rate, color=use_color() and not args.no_color,
+                        action_log=args.action_log, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Black Clover MUD as a multi-player telnet/TCP server.")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    check_server_arguments(parser, args)
+
+    raise_open_file_limit()
+    server = server_from_args(args, game_from_args(args))
+    if args.metrics:
+        serve_metrics(args.metrics)
+        server.add_metrics()
+    asyncio.run(server.serve())
+
+
+if __name__ == "__main__":
+    main()
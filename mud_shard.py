@@ -0,0 +1,436 @@
+"""Run the server as several game processes, each owning a shard of players.
+
+A player belongs to shard shard_of(name, shards): a stable hash of the
+case-folded name, the same key login_player looks players up by. The front
+process only accepts connections, asks for the player's name and passes the
+client socket itself (SCM_RIGHTS over a Unix socket pair) to the owning
+shard, so it never touches game traffic. Each shard is an ordinary
+MUDServer with its own roster, world tick, hasher pool and store, and runs
+on its own core.
+
+Shard i of n keeps its players in LoadData/shards/i-of-n, created on first
+start from the players in LoadData that hash to it (changing n starts again
+from LoadData). Names owned by another shard cannot be created or played on
+this one; the player is told to reconnect with that name.
+
+Every few seconds each shard writes a summary of its leaderboard to
+LoadData/shards (its top players and a count per rank key) and reads the
+others', so the leaderboard shows every shard as of the last exchange. The
+summary does not grow with the roster. For the player list, each shard
+also writes its roster (every player's name and magic type) there, only
+when players join or leave; a player asking for the list reads the other
+shards' rosters on the read pool, so it never opens their stores.
+
+Run from the repository root with the mud_server options plus --shards:
+    python mud_shard.py --port 4000 --shards 4
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import zlib
+
+from mud_codec import dumps, loads
+from mud_game import BlackCloverMUD, Leaderboard, Player, say
+from mud_metrics import serve_metrics
+from mud_server import (MUDServer, add_server_arguments, check_server_arguments, clean_line,
+                        game_from_args, raise_open_file_limit, server_from_args)
+from mud_storage import open_store
+
+SUMMARY_TOP = 100           # Leaderboard entries each shard shares
+GREETING = b"Welcome to Black Clover MUD.\r\nEnter your name to connect: "
+HANDOFF = b'C'              # Prefix of a handoff message; an empty message means stop
+
+
+def shard_of(name, shards):
+    return zlib.crc32(name.casefold().encode('utf-8')) % shards
+
+
+def shards_folder(data_folder):
+    return os.path.join(data_folder, 'shards')
+
+
+def shard_folder(data_folder, index, shards):
+    return os.path.join(shards_folder(data_folder), f'{index}-of-{shards}')
+
+
+def summary_path(data_folder, index, shards):
+    return os.path.join(shards_folder(data_folder), f'summary-{index}-of-{shards}.json')
+
+
+def roster_path(data_folder, index, shards):
+    return os.path.join(shards_folder(data_folder), f'roster-{index}-of-{shards}.json')
+
+
+def shard_address(address, index):
+    """The metrics address for one shard: the port plus its index, or the socket path plus '.index'."""
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        return f"{host}:{int(port) + index}"
+    return f"{address}.{index}"
+
+
+def seed_shard(kind, data_folder, index, shards):
+    """Create the shard's folder from its players in the unsharded data folder, once."""
+    folder = shard_folder(data_folder, index, shards)
+    if os.path.exists(folder):
+        return folder
+    temp = folder + '.tmp'
+    shutil.rmtree(temp, ignore_errors=True)
+    base = open_store(kind, data_folder)
+    try:
+        players = [Player.from_record(record) for record in base.load_players()
+                   if shard_of(record[0] if isinstance(record, list) else record['name'], shards) == index]
+    finally:
+        base.close()
+    store = open_store(kind, temp)
+    try:
+        store.save_players(players, players)
+    finally:
+        store.close()
+    if kind == 'json':
+        # Save Game files; SQLite keeps those in the players table
+        for file_name in os.listdir(data_folder):
+            if file_name.endswith('_save.json') and shard_of(file_name[:-len('_save.json')], shards) == index:
+                shutil.copy(os.path.join(data_folder, file_name), temp)
+    os.replace(temp, folder)
+    return folder
+
+
+# ------------------ Shard Game ------------------ #
+class ShardGame(BlackCloverMUD):
+    """A BlackCloverMUD holding one shard's players, with views over every shard."""
+
+    def __init__(self, *args, shard=0, shards=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shard = shard
+        self.shards = shards
+        self.remote = {}    # shard index -> that shard's latest summary
+        self.version = 0    # Bumped by every change a summary shows
+        self.roster_version = 0     # Bumped when players join, leave or are loaded
+
+    def owns(self, name):
+        return shard_of(name, self.shards) == self.shard
+
+    def elsewhere(self, name):
+        if self.owns(name):
+            return False
+        say(f"{name} plays on another shard. Reconnect and enter that name to play as them.")
+        return True
+
+    def player_changed(self, player):
+        super().player_changed(player)
+        self.version += 1
+
+    def create_player(self, name, magic_type, password):
+        if self.elsewhere(name):
+            return False
+        created = yield from super().create_player(name, magic_type, password)
+        if created:
+            self.roster_version += 1
+        return created
+
+    def login_player(self, entered_name, entered_password):
+        if self.elsewhere(entered_name):
+            return None
+        return (yield from super().login_player(entered_name, entered_password))
+
+    def load_game(self, player_name):
+        if self.elsewhere(player_name):
+            return None
+        self.version += 1
+        self.roster_version += 1
+        return (yield from super().load_game(player_name))
+
+    def delete_player_data(self, player_name):
+        if self.elsewhere(player_name):
+            return
+        self.version += 1
+        self.roster_version += 1
+        yield from super().delete_player_data(player_name)
+
+    # -------- Summaries -------- #
+    def summary(self):
+        players = self.players
+        return {'shard': self.shard,
+                'top': [[player.name, player.level, player.sword_awards, player.kingdoms_won]
+                        for player in players.leaderboard_page(0, SUMMARY_TOP)],
+                'ranks': [[swords, level, count] for (swords, level), count in players.leaderboard.counts()]}
+
+    def roster(self):
+        return [[name, magic_type] for name, magic_type in self.players.summaries()]
+
+    def list_players(self):
+        say("Current Players:")
+        for shard in range(self.shards):
+            if shard == self.shard:
+                summaries = self.players.summaries()
+            else:
+                summaries = yield from self.reading(self.shard_summaries, shard)
+            for name, magic_type in summaries:
+                say(f"- {name}, {magic_type} mage")
+
+    def shard_summaries(self, shard):
+        """(name, magic type) for another shard's players, from the roster it last wrote; runs on the read pool."""
+        try:
+            with open(roster_path(self.data_folder, shard, self.shards), 'rb') as file:
+                return loads(file.read())
+        except (OSError, ValueError):
+            return []       # Not written yet
+
+    def display_leaderboard(self, limit=None, offset=0, viewer=None):
+        # Other shards only share their top SUMMARY_TOP players, so pages
+        # past that are this shard's players alone.
+        entries = [(Leaderboard.rank_key(player), player.name, player.level, player.sword_awards,
+                    player.kingdoms_won)
+                   for player in self.players.leaderboard_page(0, None if limit is None else offset + limit)]
+        total = len(self.players.leaderboard)
+        for summary in self.remote.values():
+            entries.extend(((len(swords), level), name, level, swords, kingdoms)
+                           for name, level, swords, kingdoms in summary['top'])
+            total += sum(count for _, _, count in summary['ranks'])
+        entries.sort(key=lambda entry: entry[0], reverse=True)
+        end = None if limit is None else offset + limit
+
+        say("\nLeaderboard:")
+        for i, (_, name, level, swords, kingdoms) in enumerate(entries[offset:end], start=offset + 1):
+            swords_earned = ', '.join(swords) if swords else 'None'
+            kingdoms_won = ', '.join(kingdoms) if kingdoms else 'None'
+            say(f"{i}. {name} - Level: {level}, Swords: {swords_earned}, Kingdoms Conquered: {kingdoms_won}")
+        if limit is not None and total > offset + limit:
+            say(f"... {total - offset - limit} more players")
+        if viewer is not None:
+            rank = self.players.leaderboard.rank_of(self.players.key(viewer.name))
+            if rank is not None:
+                viewer_key = Leaderboard.rank_key(viewer)
+                rank += sum(count for summary in self.remote.values()
+                            for swords, level, count in summary['ranks'] if (swords, level) > viewer_key)
+                say(f"Your rank: {rank} of {total}")
+
+
+# ------------------ Shard Worker ------------------ #
+class ShardWorker(MUDServer):
+    """A MUDServer taking its clients from the front process instead of a port."""
+
+    def __init__(self, game, channel=None, data_folder=BlackCloverMUD.data_folder, summary_interval=2.0,
+                 **kwargs):
+        super().__init__(game, **kwargs)
+        self.channel = channel
+        self.data_folder = data_folder
+        self.summary_interval = summary_interval
+        self.adopting = set()
+        self.summary_times = {}     # shard index -> mtime of the summary last read
+
+    async def listen(self):
+        self.channel.setblocking(False)
+        asyncio.get_running_loop().add_reader(self.channel, self.receive)
+        print(f"Shard {self.game.shard} of {self.game.shards} ready ({len(self.game.players)} players)")
+
+    async def stop_listening(self):
+        asyncio.get_running_loop().remove_reader(self.channel)
+
+    def receive(self):
+        try:
+            message, fds, _, _ = socket.recv_fds(self.channel, 1 << 16, 1)
+        except BlockingIOError:
+            return
+        except OSError:
+            message, fds = b'', []
+        if not message.startswith(HANDOFF) or not fds:
+            # The front process stopped (or sent nonsense): shut down too
+            for fd in fds:
+                os.close(fd)
+            asyncio.get_running_loop().remove_reader(self.channel)
+            self.stopped.set()
+            return
+        task = asyncio.create_task(self.adopt(fds[0], message[len(HANDOFF):]))
+        self.adopting.add(task)
+        task.add_done_callback(self.adopting.discard)
+
+    async def adopt(self, fd, typed_ahead):
+        """Serve a client socket handed over by the front, after what it already read past the name."""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=self.max_line, loop=loop)
+        reader.feed_data(typed_ahead)
+        protocol = asyncio.StreamReaderProtocol(reader, loop=loop)
+        try:
+            transport, _ = await loop.create_connection(lambda: protocol, sock=socket.socket(fileno=fd))
+        except OSError:
+            return
+        await self.handle_client(reader, asyncio.StreamWriter(transport, protocol, reader, loop))
+
+    def background(self):
+        return super().background() + [self.exchange_summaries()]
+
+    async def exchange_summaries(self):
+        loop = asyncio.get_running_loop()
+        published = roster_published = None
+        while True:
+            if self.game.version != published:
+                published = self.game.version
+                data = dumps(self.game.summary())
+                await loop.run_in_executor(None, self.write_view, summary_path, data)
+            if self.game.roster_version != roster_published:
+                roster_published = self.game.roster_version
+                data = dumps(self.game.roster())
+                await loop.run_in_executor(None, self.write_view, roster_path, data)
+            self.game.remote = await loop.run_in_executor(None, self.read_summaries, self.game.remote)
+            await asyncio.sleep(self.summary_interval)
+
+    def write_view(self, path_of, data):
+        # Only a view for the other shards, rewritten every few seconds; no fsync
+        path = path_of(self.data_folder, self.game.shard, self.game.shards)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(data)
+        os.replace(path + '.tmp', path)
+
+    def read_summaries(self, current):
+        """The other shards' summaries, reading only files changed since last time."""
+        summaries = dict(current)
+        for shard in range(self.game.shards):
+            if shard == self.game.shard:
+                continue
+            path = summary_path(self.data_folder, shard, self.game.shards)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                if self.summary_times.get(shard) == mtime:
+                    continue
+                with open(path, 'rb') as file:
+                    summaries[shard] = loads(file.read())
+            except (OSError, ValueError):
+                # Not written yet, or replaced while reading: try again next time
+                continue
+            self.summary_times[shard] = mtime
+        return summaries
+
+
+def run_shard(args, index, channel):
+    raise_open_file_limit()
+    folder = seed_shard(args.storage, BlackCloverMUD.data_folder, index, args.shards)
+    game = game_from_args(args, folder, ShardGame, shard=index, shards=args.shards)
+    server = server_from_args(args, game, ShardWorker, channel=channel)
+    if args.metrics:
+        serve_metrics(shard_address(args.metrics, index))
+        server.add_metrics()
+    asyncio.run(server.serve())
+
+
+# ------------------ Front Process ------------------ #
+class ShardRouter:
+    """Accepts clients, asks for a name and hands each socket to the shard owning that name."""
+
+    def __init__(self, channels, host='0.0.0.0', port=4000, max_line=1024, idle_timeout=None):
+        self.channels = channels
+        self.host = host
+        self.port = port
+        self.max_line = max_line
+        self.idle_timeout = idle_timeout
+        self.routing = set()
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        listener = socket.create_server((self.host, self.port), backlog=1024)
+        listener.setblocking(False)
+        print(f"Black Clover MUD listening on {self.host}:{self.port} with {len(self.channels)} shards")
+
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        accept_task = asyncio.create_task(self.accept(listener))
+        await stop.wait()
+        accept_task.cancel()
+        listener.close()
+        # Shards stop when their channel closes
+        for channel in self.channels:
+            channel.close()
+
+    async def accept(self, listener):
+        loop = asyncio.get_running_loop()
+        while True:
+            client, _ = await loop.sock_accept(listener)
+            task = asyncio.create_task(self.route(client))
+            self.routing.add(task)
+            task.add_done_callback(self.routing.discard)
+
+    async def route(self, client):
+        loop = asyncio.get_running_loop()
+        try:
+            name, typed_ahead = await asyncio.wait_for(self.read_name(client), self.idle_timeout)
+            if name is not None:
+                try:
+                    socket.send_fds(self.channels[shard_of(name, len(self.channels))],
+                                    [HANDOFF + typed_ahead], [client.fileno()])
+                except OSError:
+                    await loop.sock_sendall(client, b"That part of the world is unavailable. Please try again later.\r\n")
+        except (OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            client.close()
+
+    async def read_name(self, client):
+        """(name, bytes read after its line), or (None, b'') if the client left."""
+        loop = asyncio.get_running_loop()
+        buffer = b''
+        await loop.sock_sendall(client, GREETING)
+        while True:
+            line, newline, rest = buffer.partition(b'\n')
+            if newline:
+                name = clean_line(line).strip()
+                if name:
+                    return name, rest
+                buffer = rest
+                await loop.sock_sendall(client, GREETING[GREETING.index(b'\n') + 1:])
+                continue
+            if len(buffer) > self.max_line:
+                return None, b''
+            chunk = await loop.sock_recv(client, 1024)
+            if not chunk:
+                return None, b''
+            buffer += chunk
+
+
+def run_sharded(args):
+    os.makedirs(shards_folder(BlackCloverMUD.data_folder), exist_ok=True)
+    # Spawned, not forked: each shard starts clean, without the front's state
+    context = multiprocessing.get_context('spawn')
+    channels = []
+    workers = []
+    for index in range(args.shards):
+        front, back = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        worker = context.Process(target=run_shard, args=(args, index, back), name=f'shard-{index}')
+        worker.start()
+        back.close()
+        channels.append(front)
+        workers.append(worker)
+    raise_open_file_limit()
+    try:
+        asyncio.run(ShardRouter(channels, args.host, args.port, idle_timeout=args.idle_timeout).serve())
+    finally:
+        for channel in channels:
+            channel.close()
+        for worker in workers:
+            worker.join()
+
+
+# ------------------ Main Execution ------------------ #
+def main():
+    parser = argparse.ArgumentParser(description="Run Black Clover MUD as a sharded multi-process server.")
+    add_server_arguments(parser)
+    parser.add_argument('--shards', type=int, default=os.cpu_count() or 1,
+                        help="Game processes; each owns the players whose name hashes to it.")
+    args = parser.parse_args()
+    check_server_arguments(parser, args)
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    run_sharded(args)
+
+
+if __name__ == "__main__":
+    main()
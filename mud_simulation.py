@@ -0,0 +1,302 @@
+"""Headless battle and quest simulation for balancing.
+
+Runs batches of fights through the same rules as the interactive battle
+(mud_battle.Fight), with a policy object choosing each action, and reports
+win rate, turns to kill and mana exhaustion per magic type, player level,
+battle level and policy, plus the quest success rate.
+
+Work is split into chunks that run on a process pool, one worker per core by
+default. Every chunk has its own seed derived from --seed and the chunk's
+position, so results are the same for any number of workers.
+
+    python mud_simulation.py --fights 100000 --player-levels 1 5 10
+    python mud_simulation.py --fights 10000000 --quests 100000000 --enemy-hp 25
+    python mud_simulation.py --scaling
+"""
+import argparse
+import concurrent.futures
+import os
+import random
+import sys
+import time
+
+from mud_battle import DEFAULT_TUNING, LEVELS, attempt_quest, default_content, run_fight
+from mud_game import BlackCloverMUD, Player
+
+
+# ------------------ Policies ------------------ #
+class AttackPolicy:
+    name = 'attack'
+
+    def choose(self, fight):
+        return 'attack', None
+
+
+class SpellPolicy:
+    """Cast the default spell while mana lasts, then attack."""
+    name = 'spell'
+
+    def choose(self, fight):
+        if fight.spell and fight.player.mana >= fight.spell['cost']:
+            return 'spell', None
+        return 'attack', None
+
+
+class CarefulPolicy(SpellPolicy):
+    """Like SpellPolicy, but drinks potions when HP runs low or mana runs out."""
+    name = 'careful'
+
+    def choose(self, fight):
+        player = fight.player
+        inventory = player.inventory
+        if player.hp * 3 < player.max_hp and inventory.get("Health Potion", 0) > 0:
+            return 'item', "Health Potion"
+        if fight.spell and player.mana < fight.spell['cost'] and inventory.get("Mana Potion", 0) > 0:
+            return 'item', "Mana Potion"
+        return super().choose(fight)
+
+
+POLICIES = {policy.name: policy for policy in (AttackPolicy, SpellPolicy, CarefulPolicy)}
+
+
+# ------------------ Results ------------------ #
+class FightStats:
+    """Totals for a batch of fights; batches merge by adding totals."""
+
+    FIELDS = ('fights', 'won', 'lost', 'fled', 'timed_out', 'turns_to_kill', 'mana_exhausted')
+
+    def __init__(self, **totals):
+        for field in self.FIELDS:
+            setattr(self, field, totals.get(field, 0))
+
+    def record(self, fight):
+        self.fights += 1
+        if fight.outcome == 'won':
+            self.won += 1
+            self.turns_to_kill += fight.turns
+        elif fight.outcome == 'lost':
+            self.lost += 1
+        elif fight.outcome == 'fled':
+            self.fled += 1
+        else:
+            self.timed_out += 1
+        if fight.out_of_mana:
+            self.mana_exhausted += 1
+
+    def merge(self, other):
+        for field in self.FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        return self
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @property
+    def trials(self):
+        return self.fights
+
+    @property
+    def win_rate(self):
+        return self.won / self.fights if self.fights else 0.0
+
+    @property
+    def mean_turns_to_kill(self):
+        return self.turns_to_kill / self.won if self.won else float('nan')
+
+    @property
+    def mana_exhaustion_rate(self):
+        return self.mana_exhausted / self.fights if self.fights else 0.0
+
+
+class QuestStats:
+    FIELDS = ('attempts', 'successes')
+
+    def __init__(self, attempts=0, successes=0):
+        self.attempts = attempts
+        self.successes = successes
+
+    def merge(self, other):
+        self.attempts += other.attempts
+        self.successes += other.successes
+        return self
+
+    @property
+    def trials(self):
+        return self.attempts
+
+    @property
+    def success_rate(self):
+        return self.successes / self.attempts if self.attempts else 0.0
+
+
+# ------------------ Batches ------------------ #
+def make_player(magic_type, level):
+    """A fresh player at `level`, with the stats level_up would have given it."""
+    player = Player("Sim", magic_type, "")
+    for _ in range(level - 1):
+        player.level_up()
+    return player
+
+
+def batch_seed(seed, *key):
+    # A string seed gives every batch (and every chunk of it) its own
+    # reproducible stream, independent of which worker runs it.
+    return ':'.join(str(part) for part in (seed,) + key)
+
+
+def simulate_batch(magic_type, player_level, level_index, policy_name, fights, seed=0, chunk=0, tuning=None):
+    """Run `fights` independent fights and return their FightStats."""
+    rng = random.Random(batch_seed(seed, magic_type, player_level, level_index, policy_name, chunk))
+    policy = POLICIES[policy_name]()
+    player = make_player(magic_type, player_level)
+    starting_inventory = dict(player.inventory)
+    stats = FightStats()
+    for _ in range(fights):
+        player.inventory = dict(starting_inventory)
+        stats.record(run_fight(player, level_index, policy, rng, tuning))
+    return stats
+
+
+def simulate_quests(attempts, seed=0, chunk=0, tuning=None):
+    rng = random.Random(batch_seed(seed, 'quest', chunk))
+    player = Player("Sim", "Fire", "")
+    successes = 0
+    for _ in range(attempts):
+        successes += attempt_quest(player, rng, tuning)
+    return QuestStats(attempts, successes)
+
+
+def batch_keys(magic_types, player_levels, level_indexes, policy_names):
+    return [(magic_type, player_level, level_index, policy_name)
+            for magic_type in magic_types
+            for player_level in player_levels
+            for level_index in level_indexes
+            for policy_name in policy_names]
+
+
+# ------------------ Parallel Runner ------------------ #
+def make_jobs(keys, fights, quests, chunk_size, seed, tuning):
+    """(result key, function, args) for every chunk of work."""
+    jobs = []
+    for key in keys:
+        for chunk, start in enumerate(range(0, fights, chunk_size)):
+            jobs.append((key, simulate_batch, key + (min(chunk_size, fights - start), seed, chunk, tuning)))
+    for chunk, start in enumerate(range(0, quests, chunk_size)):
+        jobs.append(('quest', simulate_quests, (min(chunk_size, quests - start), seed, chunk, tuning)))
+    return jobs
+
+
+def run_jobs(jobs, workers, progress=None):
+    """Run jobs on `workers` processes, merging each chunk's stats as it arrives."""
+    results = {}
+    done = 0
+    if workers <= 1:
+        completed = ((key, func(*args)) for key, func, args in jobs)
+    else:
+        completed = _run_on_pool(jobs, workers)
+    for key, stats in completed:
+        if key in results:
+            results[key].merge(stats)
+        else:
+            results[key] = stats
+        done += 1
+        if progress:
+            progress(done, len(jobs))
+    return results
+
+
+def _run_on_pool(jobs, workers):
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(func, *args): key for key, func, args in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.result()
+
+
+def timed_run(jobs, workers, progress=None):
+    start = time.perf_counter()
+    results = run_jobs(jobs, workers, progress)
+    elapsed = time.perf_counter() - start
+    trials = sum(stats.trials for stats in results.values())
+    return results, trials, elapsed
+
+
+def report_progress(done, total):
+    print(f"\r{done}/{total} chunks", end='' if done < total else '\n', file=sys.stderr, flush=True)
+
+
+def print_report(results, keys):
+    print(f"{'magic':<10} {'lvl':>3} {'battle':<10} {'policy':<8} {'fights':>9} "
+          f"{'win%':>6} {'turns/kill':>10} {'no-mana%':>8}")
+    for key in keys:
+        magic_type, player_level, level_index, policy_name = key
+        stats = results[key]
+        print(f"{magic_type:<10} {player_level:>3} {LEVELS[level_index]:<10} {policy_name:<8} "
+              f"{stats.fights:>9} {stats.win_rate:>6.1%} {stats.mean_turns_to_kill:>10.2f} "
+              f"{stats.mana_exhaustion_rate:>8.1%}")
+    if 'quest' in results:
+        quests = results['quest']
+        print(f"\nQuests: {quests.attempts} attempts, {quests.success_rate:.2%} successful")
+
+
+def add_batch_arguments(parser):
+    parser.add_argument('--fights', type=int, default=10000, help="Fights per combination.")
+    parser.add_argument('--magic-types', nargs='+', default=BlackCloverMUD.valid_magic_types,
+                        choices=sorted(default_content().spells))
+    parser.add_argument('--player-levels', nargs='+', type=int, default=[1, 5, 10])
+    parser.add_argument('--battle-levels', nargs='+', choices=LEVELS, default=LEVELS)
+    parser.add_argument('--policies', nargs='+', choices=sorted(POLICIES), default=sorted(POLICIES))
+    parser.add_argument('--quests', type=int, default=0, help="Quest attempts to simulate.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--enemy-hp', type=int, default=DEFAULT_TUNING['enemy_hp'])
+    parser.add_argument('--enemy-hp-per-level', type=int, default=DEFAULT_TUNING['enemy_hp_per_level'])
+    parser.add_argument('--attack-min', type=int, default=DEFAULT_TUNING['attack_min'])
+    parser.add_argument('--attack-max', type=int, default=DEFAULT_TUNING['attack_max'])
+    parser.add_argument('--quest-success', type=float, default=DEFAULT_TUNING['quest_success'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk', type=int, default=50000, help="Fights or quests per work unit.")
+
+
+def tuning_from_args(args):
+    tuning = dict(DEFAULT_TUNING)
+    tuning.update(enemy_hp=args.enemy_hp, enemy_hp_per_level=args.enemy_hp_per_level,
+                  attack_min=args.attack_min, attack_max=args.attack_max,
+                  quest_success=args.quest_success)
+    return tuning
+
+
+def print_scaling(jobs, max_workers):
+    """Run the same jobs with 1, 2, 4 ... workers and print the speedup."""
+    counts = sorted({1, max_workers} | {2 ** i for i in range(max_workers.bit_length()) if 2 ** i <= max_workers})
+    baseline = None
+    print(f"{'workers':>7} {'trials/s':>12} {'speedup':>8} {'efficiency':>10}")
+    for workers in counts:
+        _, trials, elapsed = timed_run(jobs, workers)
+        rate = trials / elapsed
+        baseline = baseline or rate
+        print(f"{workers:>7} {rate:>12,.0f} {rate / baseline:>8.2f} {rate / baseline / workers:>10.0%}")
+
+
+# ------------------ Main Execution ------------------ #
+def main():
+    parser = argparse.ArgumentParser(description="Simulate battles and quests headlessly to check balance.")
+    add_batch_arguments(parser)
+    parser.add_argument('--scaling', action='store_true',
+                        help="Measure throughput with 1 up to --workers processes instead of reporting results.")
+    args = parser.parse_args()
+
+    keys = batch_keys(args.magic_types, args.player_levels,
+                      [LEVELS.index(level) for level in args.battle_levels], args.policies)
+    jobs = make_jobs(keys, args.fights, args.quests, args.chunk, args.seed, tuning_from_args(args))
+    if args.scaling:
+        print_scaling(jobs, args.workers)
+        return
+
+    progress = report_progress if sys.stderr.isatty() else None
+    results, trials, elapsed = timed_run(jobs, args.workers, progress)
+    print_report(results, keys)
+    print(f"\n{trials} trials in {elapsed:.2f}s on {args.workers} worker(s): "
+          f"{trials / elapsed:,.0f} trials/s, {trials / elapsed / args.workers:,.0f} per worker")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""A binary, memory-mapped snapshot of the roster for fast startup.
+
+Loading players_data.json means parsing every record and building every
+Player before the first prompt. The snapshot instead holds the roster in
+columns that are used in place through mmap, so opening it costs the same
+for ten players or a million:
+
+    MUDSNAP3, header offset (u64), header length (u64)
+    rows          each player's mud_codec row (JSON), decoded when touched
+    row_offsets   u64 per player + 1
+    names         UTF-8 names, back to back
+    name_offsets  u32 per player + 1
+    magic         index into the header's magic types
+    level         u32
+    swords        number of swords
+    kingdom_offsets  u32 per player + 1
+    kingdoms      indexes into the header's kingdoms, each player's in the
+                  order won, back to back
+    ranked        u32 player numbers, best (swords, level) first
+    slots         u32 open-addressing table of player number + 1 by
+                  crc32 of the case-folded name; 0 is an empty slot
+    by_magic      u32 player numbers grouped by magic type, each group
+                  starting at the header's by_magic_starts
+    by_kingdom    u32 player numbers grouped by kingdom won, likewise
+    header        JSON: counts, section offsets and types, the row fields,
+                  string tables, group starts, the number of players per
+                  rank key, and the store's fingerprint
+
+magic, swords and kingdoms are stored as u8, u16 or u32, the smallest
+that holds the file's largest value. The rows are in PLAYER_FIELDS order
+as of writing; a snapshot written with other fields is not opened.
+
+The fingerprint (PlayerStore.fingerprint) is the state of the store the
+snapshot was written from. If the store changed since, through an autosave
+after the last exit or a crash, the snapshot is stale and the caller loads
+from the store instead. See SnapshotRegistry in mud_game for the lazy
+player registry built on top.
+"""
+import array
+import itertools
+import json
+import mmap
+import struct
+import zlib
+
+from mud_codec import PLAYER_FIELDS, dumps, loads
+from mud_storage import atomic_file
+
+MAGIC = b'MUDSNAP3'
+PREFIX = struct.Struct('<8sQQ')
+# name -> array typecode; the order sections are written in after the rows
+COLUMNS = (('row_offsets', 'Q'), ('name_offsets', 'I'), ('magic', 'I'), ('level', 'I'),
+           ('swords', 'I'), ('kingdom_offsets', 'I'), ('kingdoms', 'I'), ('ranked', 'I'),
+           ('slots', 'I'), ('by_magic', 'I'), ('by_kingdom', 'I'))
+# Written with the smallest of these typecodes their values fit in
+NARROWED = ('magic', 'swords', 'kingdoms')
+NARROW_CODES = ('B', 'H', 'I')
+
+
+def name_hash(key):
+    return zlib.crc32(key.encode('utf-8'))
+
+
+def player_entry(player):
+    """What the snapshot keeps of a Player: (name, magic type, level, sword count, kingdoms won, row)."""
+    return (player.name, player.magic_type, player.level, player.sword_count, player.kingdoms_won,
+            dumps(player.to_row()))
+
+
+# ------------------ Writing ------------------ #
+def write_player_snapshot(path, entries, fingerprint):
+    """Write entries (see player_entry) to path, atomically; returns how many were written."""
+    magic_types = {}
+    kingdoms = {}
+    columns = {name: array.array(code) for name, code in COLUMNS}
+    by_magic = []       # per magic type code, the numbers of its players
+    by_kingdom = []     # per kingdom code, the numbers of the players who won it
+    names = bytearray()
+    columns['row_offsets'].append(PREFIX.size)
+    columns['name_offsets'].append(0)
+    columns['kingdom_offsets'].append(0)
+    with atomic_file(path) as file:
+        file.write(PREFIX.pack(MAGIC, 0, 0))
+        position = PREFIX.size
+        for number, (name, magic_type, level, sword_count, kingdoms_won, row) in enumerate(entries):
+            file.write(row)
+            position += len(row)
+            columns['row_offsets'].append(position)
+            names += name.encode('utf-8')
+            columns['name_offsets'].append(len(names))
+            code = _code(magic_types, magic_type, by_magic)
+            columns['magic'].append(code)
+            by_magic[code].append(number)
+            columns['level'].append(level)
+            columns['swords'].append(sword_count)
+            won = columns['kingdoms']
+            first = len(won)
+            for kingdom in kingdoms_won:
+                code = _code(kingdoms, kingdom, by_kingdom)
+                if code not in won[first:]:
+                    won.append(code)
+                    by_kingdom[code].append(number)
+            columns['kingdom_offsets'].append(len(won))
+
+        count = len(columns['level'])
+        by_magic_starts = _concatenate(by_magic, columns['by_magic'])
+        by_kingdom_starts = _concatenate(by_kingdom, columns['by_kingdom'])
+        swords, levels = columns['swords'], columns['level']
+        # Stable, so players with the same rank key keep the roster's order
+        columns['ranked'] = array.array('I', sorted(range(count), key=lambda i: (swords[i], levels[i]),
+                                                    reverse=True))
+        rank_counts = [[sword_count, level, len(list(group))] for (sword_count, level), group in
+                       itertools.groupby((swords[i], levels[i]) for i in columns['ranked'])]
+        columns['slots'] = _slots(names, columns['name_offsets'], count)
+        for name in NARROWED:
+            columns[name] = _narrow(columns[name])
+
+        sections = {}
+        position = _write_section(file, position, 'names', names, sections, 'B')
+        for name, _ in COLUMNS:
+            column = columns[name]
+            position = _write_section(file, position, name, column.tobytes(), sections, column.typecode)
+        header = json.dumps({'count': count, 'sections': sections, 'fields': list(PLAYER_FIELDS),
+                             'magic_types': list(magic_types), 'kingdoms': list(kingdoms),
+                             'by_magic_starts': by_magic_starts,
+                             'by_kingdom_starts': by_kingdom_starts, 'rank_counts': rank_counts,
+                             'fingerprint': fingerprint}).encode('utf-8')
+        file.write(header)
+        file.seek(0)
+        file.write(PREFIX.pack(MAGIC, position, len(header)))
+    return count
+
+
+def _code(codes, value, groups):
+    """value's code in the string table codes, adding it (and an empty group) if new."""
+    code = codes.get(value)
+    if code is None:
+        code = codes[value] = len(codes)
+        groups.append(array.array('I'))
+    return code
+
+
+def _narrow(column):
+    largest = max(column, default=0)
+    for code in NARROW_CODES:
+        if largest < 1 << 8 * array.array(code).itemsize:
+            return array.array(code, column)
+    return column
+
+
+def _concatenate(groups, column):
+    """Append the groups to column; returns where each starts, plus the end."""
+    starts = [0]
+    for group in groups:
+        column.extend(group)
+        starts.append(len(column))
+    return starts
+
+
+def _write_section(file, position, name, data, sections, code):
+    padding = -position % 8
+    file.write(b'\0' * padding)
+    position += padding
+    file.write(data)
+    sections[name] = [position, len(data), code]
+    return position + len(data)
+
+
+def _slots(names, name_offsets, count):
+    size = 1 << max(3, (2 * count).bit_length())
+    mask = size - 1
+    slots = array.array('I', bytes(4 * size))
+    for i in range(count):
+        key = names[name_offsets[i]:name_offsets[i + 1]].decode('utf-8').casefold()
+        slot = name_hash(key) & mask
+        while slots[slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = i + 1
+    return slots
+
+
+# ------------------ Reading ------------------ #
+class PlayerSnapshot:
+    """A snapshot file opened through mmap; nothing is decoded until asked for."""
+
+    def __init__(self, mapped, header):
+        self.mapped = mapped
+        self.count = header['count']
+        self.magic_types = header['magic_types']
+        self.kingdom_names = header['kingdoms']
+        self.rank_counts = [((swords, level), count) for swords, level, count in header['rank_counts']]
+        self.by_magic_starts = header['by_magic_starts']
+        self.by_kingdom_starts = header['by_kingdom_starts']
+        view = memoryview(mapped)
+        for name, (offset, length, code) in header['sections'].items():
+            setattr(self, name, view[offset:offset + length].cast(code))
+        self.slot_mask = len(self.slots) - 1
+
+    @classmethod
+    def open(cls, path, fingerprint):
+        """The snapshot at path, or None if it is missing, unreadable or not from this store state."""
+        try:
+            with open(path, 'rb') as file:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            magic, header_offset, header_length = PREFIX.unpack_from(mapped)
+            if magic != MAGIC or header_offset + header_length != len(mapped):
+                raise ValueError("not a complete snapshot")
+            header = json.loads(mapped[header_offset:header_offset + header_length])
+            # Compared as JSON, which is how it was stored
+            if header['fingerprint'] != json.loads(json.dumps(fingerprint)):
+                raise ValueError("stale snapshot")
+            if header['fields'] != list(PLAYER_FIELDS):
+                raise ValueError("rows written with other fields")
+            return cls(mapped, header)
+        except (ValueError, KeyError, struct.error):
+            mapped.close()
+            return None
+
+    def __len__(self):
+        return self.count
+
+    def name(self, i):
+        return str(self.names[self.name_offsets[i]:self.name_offsets[i + 1]], 'utf-8')
+
+    def key(self, i):
+        return self.name(i).casefold()
+
+    def magic_type(self, i):
+        return self.magic_types[self.magic[i]]
+
+    def rank_key(self, i):
+        return (self.swords[i], self.level[i])
+
+    def kingdoms_won(self, i):
+        names = self.kingdom_names
+        return [names[code] for code in self.kingdoms[self.kingdom_offsets[i]:self.kingdom_offsets[i + 1]]]
+
+    def with_magic_type(self, magic_type):
+        """The numbers of the players of a magic type, from the index written with the snapshot."""
+        return self._group(self.by_magic, self.by_magic_starts, self.magic_types, magic_type)
+
+    def with_kingdom_won(self, kingdom):
+        """The numbers of the players who won a kingdom, likewise."""
+        return self._group(self.by_kingdom, self.by_kingdom_starts, self.kingdom_names, kingdom)
+
+    @staticmethod
+    def _group(column, starts, names, name):
+        try:
+            code = names.index(name)
+        except ValueError:
+            return column[:0]
+        return column[starts[code]:starts[code + 1]]
+
+    def raw_row(self, i):
+        return self.mapped[self.row_offsets[i]:self.row_offsets[i + 1]]
+
+    def row(self, i):
+        return loads(self.raw_row(i))
+
+    def entry(self, i):
+        """Player i as player_entry() would give it, without decoding its row."""
+        return (self.name(i), self.magic_type(i), self.level[i], self.swords[i], self.kingdoms_won(i),
+                self.raw_row(i))
+
+    def find(self, key):
+        """The number of the player with case-folded name key, or None."""
+        slot = name_hash(key) & self.slot_mask
+        while True:
+            number = self.slots[slot]
+            if not number:
+                return None
+            if self.key(number - 1) == key:
+                return number - 1
+            slot = (slot + 1) & self.slot_mask
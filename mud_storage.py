@@ -0,0 +1,540 @@
+import argparse
+import contextlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+
+from mud_codec import (SCHEMA_VERSION, count_snapshot_rows, dict_to_row, dumps, loads, read_snapshot,
+                       row_converter, row_to_dict, schema_fields, write_snapshot)
+from mud_metrics import METRICS
+
+ENCODE = (('op', 'encode'),)
+DECODE = (('op', 'decode'),)
+
+
+# ------------------ Atomic File Writes ------------------ #
+def fsync_directory(folder):
+    # Makes a rename durable. Not every platform can open a directory.
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def atomic_file(path):
+    """Write path through a temporary file so readers see the old or new file, never half of one."""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        yield file
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+    fsync_directory(os.path.dirname(path) or '.')
+
+
+def atomic_write_json(path, data):
+    """Replace path with data as compact JSON, atomically."""
+    with METRICS.span('mud_json_seconds', ENCODE):
+        encoded = dumps(data)
+    with atomic_file(path) as file:
+        file.write(encoded)
+
+
+# ------------------ Journaled Player Store ------------------ #
+class JournalStore:
+    """Players' data as a snapshot file plus an append-only journal.
+
+    The snapshot is a JSON list of player rows (see mud_codec). Each save
+    appends only the changed players to the journal as one JSON record per
+    line and fsyncs once for the batch. When the journal grows as large as
+    the snapshot, it is folded into a new snapshot. Loading reads the journal
+    and streams the snapshot with the journal applied over it.
+    """
+
+    def __init__(self, folder, snapshot_name='players_data.json',
+                 journal_name='players_journal.jsonl', min_compact_records=1000):
+        self.snapshot_path = os.path.join(folder, snapshot_name)
+        self.journal_path = os.path.join(folder, journal_name)
+        self.min_compact_records = min_compact_records
+        self.snapshot_records = 0
+        self.journal_records = 0
+        # Whether the counts above are known: load() and compact() set them,
+        # but a game started from a mud_snapshot file never calls load().
+        self.counted = False
+        # The autosave thread appends while the game's thread may delete or compact
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Yield the saved players as rows, in first-saved order.
+
+        The snapshot is parsed one record at a time and each row is handed on
+        before the next is read, so the roster is never held twice (parsed
+        and as players) while loading.
+        """
+        latest = {}      # name key -> journaled row; new players in first-saved order
+        deleted = set()  # keys deleted at some point: their snapshot record is stale
+        self.journal_records = 0
+        try:
+            with open(self.journal_path, 'rb') as file, METRICS.span('mud_json_seconds', DECODE):
+                for line in file:
+                    try:
+                        entry = loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-append.
+                        break
+                    self.journal_records += 1
+                    key = entry['name'].casefold()
+                    if entry['op'] == 'put':
+                        latest[key] = self._journaled_row(entry)
+                    else:
+                        latest.pop(key, None)
+                        deleted.add(key)
+        except FileNotFoundError:
+            pass
+
+        self.snapshot_records = 0
+        try:
+            # Not timed as mud_json_seconds: the stream includes the caller's
+            # work on each row. mud_load_seconds covers the whole load.
+            with open(self.snapshot_path, 'rb') as file:
+                for row in read_snapshot(file):
+                    self.snapshot_records += 1
+                    key = row[0].casefold()
+                    if key not in deleted:
+                        yield latest.pop(key, row)
+        except FileNotFoundError:
+            pass
+        self.counted = True
+        # Players saved since the snapshot, or deleted and saved again
+        yield from latest.values()
+
+    @staticmethod
+    def _journaled_row(entry):
+        if 'row' in entry:
+            convert = row_converter(schema_fields(entry['schema']))
+            return entry['row'] if convert is None else convert(entry['row'])
+        return dict_to_row(entry['player'])     # Journaled before schema 2
+
+    def append(self, players=(), deleted=()):
+        """Journal changed players and deleted names as one fsynced batch."""
+        with METRICS.span('mud_json_seconds', ENCODE):
+            lines = [dumps({'op': 'put', 'name': player.name, 'schema': SCHEMA_VERSION, 'row': player.to_row()})
+                     for player in players]
+            lines.extend(dumps({'op': 'del', 'name': name}) for name in deleted)
+        if not lines:
+            return 0
+        with self.lock, open(self.journal_path, 'ab') as file:
+            file.write(b'\n'.join(lines) + b'\n')
+            file.flush()
+            os.fsync(file.fileno())
+            self.journal_records += len(lines)
+        return len(lines)
+
+    def needs_compaction(self):
+        if not self.counted:
+            self.count()
+        return self.journal_records >= max(self.min_compact_records, self.snapshot_records)
+
+    def count(self):
+        """Set the record counts from the files without parsing records, as if load() had run."""
+        with self.lock:
+            try:
+                with open(self.snapshot_path, 'rb') as file:
+                    self.snapshot_records = count_snapshot_rows(file)
+            except FileNotFoundError:
+                self.snapshot_records = 0
+            try:
+                with open(self.journal_path, 'rb') as file:
+                    # Complete lines only: a torn final line is not a record
+                    self.journal_records = sum(chunk.count(b'\n') for chunk in iter(lambda: file.read(1 << 20), b''))
+            except FileNotFoundError:
+                self.journal_records = 0
+            self.counted = True
+
+    def compact(self, players):
+        """Write every player to a fresh snapshot and start an empty journal.
+
+        Call this only after append() has journaled every changed player, so
+        the journal's last record for each player matches the snapshot.
+        """
+        with self.lock:
+            with atomic_file(self.snapshot_path) as file, METRICS.span('mud_json_seconds', ENCODE):
+                count = write_snapshot(file, (player.to_row() for player in players))
+            # A crash before this truncate only means the old journal is replayed
+            # over the new snapshot; its last record per player is that player's
+            # snapshot state, so the result is the same.
+            with open(self.journal_path, 'w'):
+                pass
+            self.snapshot_records = count
+            self.journal_records = 0
+            self.counted = True
+
+
+# ------------------ Storage Backends ------------------ #
+class PlayerStore:
+    """Where BlackCloverMUD keeps player data.
+
+    Records are Player.to_dict() dicts; load_players may instead return rows
+    in mud_codec.PLAYER_FIELDS order (Player.from_record reads either).
+    save_players is the roster save on exit; save_player/load_player back
+    the per-player Save Game and Load Game menu options.
+
+    A store with a snapshot_path can be mirrored by a mud_snapshot file;
+    fingerprint() must then change whenever the store's players do.
+
+    A server calls load_player from up to read_concurrency threads at once
+    (see BlackCloverMUD.reading); everything else runs on the game's thread.
+    """
+    snapshot_path = None
+    read_concurrency = 1
+
+    def fingerprint(self):
+        return None
+
+    def load_players(self):
+        raise NotImplementedError
+
+    def load_index(self):
+        """(name, magic_type, level, sword count, kingdoms_won) per player, for lazy loading."""
+        raise NotImplementedError
+
+    def save_players(self, changed, players):
+        raise NotImplementedError
+
+    def save_changed(self, changed):
+        """Write just the changed players; the autosave thread calls this (see mud_autosave)."""
+        raise NotImplementedError
+
+    def save_player(self, player):
+        raise NotImplementedError
+
+    def load_player(self, name):
+        raise NotImplementedError
+
+    def delete_player(self, name):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonStore(PlayerStore):
+    """The original LoadData layout: a journaled players_data.json plus {name}_save.json files."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.journal = JournalStore(folder)
+        self.snapshot_path = os.path.join(folder, 'players.snap')
+
+    def fingerprint(self):
+        stamps = []
+        for path in (self.journal.snapshot_path, self.journal.journal_path):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stamps.append(None)
+            else:
+                stamps.append([stat.st_size, stat.st_mtime_ns])
+        return ['json'] + stamps
+
+    def save_file(self, name):
+        return os.path.join(self.folder, f"{name}_save.json")
+
+    def load_players(self):
+        return self.journal.load()
+
+    def save_players(self, changed, players):
+        self.journal.append(changed)
+        if self.journal.needs_compaction():
+            self.journal.compact(players)
+
+    def save_changed(self, changed):
+        # Only appends: compacting needs the whole roster, which belongs to
+        # the game's thread, so it waits for the next save_players.
+        self.journal.append(changed)
+
+    def save_player(self, player):
+        atomic_write_json(self.save_file(player.name), player.to_dict())
+
+    def load_player(self, name):
+        try:
+            with open(self.save_file(name), 'rb') as file, METRICS.span('mud_json_seconds', DECODE):
+                return loads(file.read())
+        except FileNotFoundError:
+            return None
+
+    def delete_player(self, name):
+        self.journal.append(deleted=[name])
+        if os.path.exists(self.save_file(name)):
+            os.remove(self.save_file(name))
+
+
+class MemoryStore(PlayerStore):
+    """Keeps records in memory only, for replays and benchmarks that must not touch LoadData."""
+
+    def __init__(self, records=()):
+        self.records = {record['name'].casefold(): record for record in records}
+        self.saves = {}
+
+    def load_players(self):
+        return list(self.records.values())
+
+    def load_index(self):
+        return [(record['name'], record['magic_type'], record['level'], len(record['sword_awards']),
+                 record['kingdoms_won']) for record in self.records.values()]
+
+    def save_players(self, changed, players):
+        self.save_changed(changed)
+
+    def save_changed(self, changed):
+        for player in changed:
+            self.records[player.name.casefold()] = player.to_dict()
+
+    def save_player(self, player):
+        self.saves[player.name.casefold()] = player.to_dict()
+
+    def load_player(self, name):
+        return self.saves.get(name.casefold())
+
+    def delete_player(self, name):
+        self.records.pop(name.casefold(), None)
+        self.saves.pop(name.casefold(), None)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL UNIQUE,
+    magic_type TEXT NOT NULL,
+    password TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    experience INTEGER NOT NULL,
+    spells TEXT NOT NULL,
+    kingdom TEXT NOT NULL,
+    magic INTEGER NOT NULL,
+    hp INTEGER NOT NULL,
+    max_hp INTEGER NOT NULL,
+    mana INTEGER NOT NULL,
+    max_mana INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS players_by_magic_type ON players (magic_type);
+CREATE INDEX IF NOT EXISTS players_by_level ON players (level);
+CREATE TABLE IF NOT EXISTS inventory (
+    player_id INTEGER NOT NULL REFERENCES players (id) ON DELETE CASCADE,
+    item TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (player_id, item)
+);
+CREATE TABLE IF NOT EXISTS swords (
+    player_id INTEGER NOT NULL REFERENCES players (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    sword TEXT NOT NULL,
+    PRIMARY KEY (player_id, position)
+);
+CREATE INDEX IF NOT EXISTS swords_by_sword ON swords (sword);
+CREATE TABLE IF NOT EXISTS kingdoms (
+    player_id INTEGER NOT NULL REFERENCES players (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    kingdom TEXT NOT NULL,
+    PRIMARY KEY (player_id, position)
+);
+CREATE INDEX IF NOT EXISTS kingdoms_by_kingdom ON kingdoms (kingdom);
+"""
+
+PLAYER_COLUMNS = ('name', 'magic_type', 'password', 'level', 'experience', 'spells',
+                  'kingdom', 'magic', 'hp', 'max_hp', 'mana', 'max_mana')
+
+
+class SQLiteStore(PlayerStore):
+    """Players in one SQLite database in WAL mode.
+
+    Scalar fields live in an indexed players table; inventory, swords and
+    kingdoms are child tables. All writes go through one connection, one
+    transaction per batch. Reads borrow a connection from a small pool; a
+    server's sessions read through a thread pool of the same size (see
+    read_concurrency), so they do not queue behind each other, behind a
+    write or on the event loop.
+    """
+
+    def __init__(self, path, pool_size=4):
+        self.path = path
+        self.read_concurrency = pool_size
+        self.snapshot_path = path + '.snap'
+        self.write_lock = threading.Lock()
+        self.writer = self._connect()
+        self.writer.executescript(SQLITE_SCHEMA)
+        self.readers = queue.LifoQueue()
+        for _ in range(pool_size):
+            self.readers.put(self._connect())
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        return connection
+
+    @contextlib.contextmanager
+    def reader(self):
+        connection = self.readers.get()
+        try:
+            yield connection
+        finally:
+            self.readers.put(connection)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.write_lock:
+            self.writer.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.writer
+                # Counts write transactions, for fingerprint()
+                version = self.writer.execute("PRAGMA user_version").fetchone()[0]
+                self.writer.execute(f"PRAGMA user_version = {version + 1}")
+            except BaseException:
+                self.writer.execute("ROLLBACK")
+                raise
+            self.writer.execute("COMMIT")
+
+    # -------- Writes -------- #
+    def _upsert(self, connection, data):
+        values = [data[column] for column in PLAYER_COLUMNS]
+        values[PLAYER_COLUMNS.index('spells')] = json.dumps(data['spells'])
+        updates = ', '.join(f"{column} = excluded.{column}" for column in PLAYER_COLUMNS)
+        player_id = connection.execute(
+            f"INSERT INTO players (name_key, {', '.join(PLAYER_COLUMNS)}) "
+            f"VALUES (?, {', '.join('?' * len(PLAYER_COLUMNS))}) "
+            f"ON CONFLICT (name_key) DO UPDATE SET {updates} RETURNING id",
+            [data['name'].casefold()] + values).fetchone()[0]
+        for table in ('inventory', 'swords', 'kingdoms'):
+            connection.execute(f"DELETE FROM {table} WHERE player_id = ?", (player_id,))
+        connection.executemany("INSERT INTO inventory VALUES (?, ?, ?)",
+                               [(player_id, item, count) for item, count in data['inventory'].items()])
+        connection.executemany("INSERT INTO swords VALUES (?, ?, ?)",
+                               [(player_id, i, sword) for i, sword in enumerate(data['sword_awards'])])
+        connection.executemany("INSERT INTO kingdoms VALUES (?, ?, ?)",
+                               [(player_id, i, kingdom) for i, kingdom in enumerate(data['kingdoms_won'])])
+
+    def save_records(self, records):
+        with self.transaction() as connection:
+            for data in records:
+                self._upsert(connection, data)
+
+    def save_players(self, changed, players):
+        self.save_records(player.to_dict() for player in changed)
+
+    def save_changed(self, changed):
+        self.save_records(player.to_dict() for player in changed)
+
+    def save_player(self, player):
+        self.save_records([player.to_dict()])
+
+    def delete_player(self, name):
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM players WHERE name_key = ?", (name.casefold(),))
+
+    # -------- Reads -------- #
+    def fingerprint(self):
+        with self.reader() as connection:
+            return ['sqlite', connection.execute("PRAGMA user_version").fetchone()[0]]
+
+    def _records(self, connection, where='', params=()):
+        records = {}
+        for row in connection.execute(
+                f"SELECT id, {', '.join(PLAYER_COLUMNS)} FROM players {where} ORDER BY id", params):
+            data = dict(zip(PLAYER_COLUMNS, row[1:]))
+            data['spells'] = json.loads(data['spells'])
+            data.update(inventory={}, sword_awards=[], kingdoms_won=[])
+            records[row[0]] = data
+        if not records:
+            return []
+        ids = "SELECT id FROM players " + where
+        for player_id, item, count in connection.execute(
+                f"SELECT player_id, item, count FROM inventory WHERE player_id IN ({ids})", params):
+            records[player_id]['inventory'][item] = count
+        for player_id, sword in connection.execute(
+                f"SELECT player_id, sword FROM swords WHERE player_id IN ({ids}) ORDER BY player_id, position", params):
+            records[player_id]['sword_awards'].append(sword)
+        for player_id, kingdom in connection.execute(
+                f"SELECT player_id, kingdom FROM kingdoms WHERE player_id IN ({ids}) ORDER BY player_id, position", params):
+            records[player_id]['kingdoms_won'].append(kingdom)
+        return list(records.values())
+
+    def load_players(self):
+        with self.reader() as connection:
+            connection.execute("BEGIN")
+            try:
+                return self._records(connection)
+            finally:
+                connection.execute("COMMIT")
+
+    def load_index(self):
+        with self.reader() as connection:
+            rows = connection.execute(
+                "SELECT name, magic_type, level,"
+                " (SELECT COUNT(*) FROM swords WHERE player_id = players.id),"
+                " (SELECT GROUP_CONCAT(kingdom, char(31)) FROM kingdoms WHERE player_id = players.id)"
+                " FROM players ORDER BY id")
+            for name, magic_type, level, sword_count, kingdoms in rows:
+                yield name, magic_type, level, sword_count, kingdoms.split('\x1f') if kingdoms else ()
+
+    def load_player(self, name):
+        with self.reader() as connection:
+            connection.execute("BEGIN")
+            try:
+                records = self._records(connection, "WHERE name_key = ?", (name.casefold(),))
+            finally:
+                connection.execute("COMMIT")
+        return records[0] if records else None
+
+    def close(self):
+        self.writer.close()
+        while not self.readers.empty():
+            self.readers.get_nowait().close()
+
+
+def open_store(kind, folder):
+    os.makedirs(folder, exist_ok=True)
+    if kind == 'sqlite':
+        return SQLiteStore(os.path.join(folder, 'players.db'))
+    return JsonStore(folder)
+
+
+# ------------------ JSON to SQLite Migration ------------------ #
+def migrate_json_to_sqlite(folder, db_path=None):
+    """Import players_data.json (+ journal) and every {name}_save.json into SQLite.
+
+    When a player is in both, the roster copy wins: it is written on every
+    exit, while a save file only changes when the player picks Save Game.
+    """
+    records = {row[0].casefold(): row_to_dict(row) for row in JsonStore(folder).load_players()}
+    for file_name in sorted(os.listdir(folder)):
+        if file_name.endswith('_save.json'):
+            with open(os.path.join(folder, file_name), 'r') as file:
+                data = json.load(file)
+            records.setdefault(data['name'].casefold(), data)
+    store = SQLiteStore(db_path or os.path.join(folder, 'players.db'))
+    try:
+        store.save_records(records.values())
+    finally:
+        store.close()
+    return len(records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import the JSON files in LoadData/ into an SQLite database.")
+    parser.add_argument('--folder', default='LoadData')
+    parser.add_argument('--db', default=None, help="Database path (default: <folder>/players.db).")
+    args = parser.parse_args()
+    count = migrate_json_to_sqlite(args.folder, args.db)
+    print(f"Imported {count} players into {args.db or os.path.join(args.folder, 'players.db')}.")
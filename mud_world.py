@@ -0,0 +1,143 @@
+"""Fixed-rate world tick for a shared server.
+
+Sessions do not resolve battle turns or quests themselves. They queue them
+with the World, and every tick resolves everything queued since the last one
+in a single pass: each player action with its enemy's reply, then every
+waiting session is answered. A battle is just its mud_battle.Fight, so
+thousands of them cost only their state plus one queue entry per pending
+action.
+
+A tick stops taking actions once WORK_SHARE of its interval has gone; the
+rest stay queued, in order, for the next tick. Under more load than a tick
+can take, actions wait a tick longer instead of every session stalling
+behind an overlong tick.
+"""
+import asyncio
+import collections
+import time
+import weakref
+
+from mud_battle import attempt_quest
+from mud_metrics import METRICS
+
+# Share of a tick spent resolving actions, leaving the rest for answering
+# the sessions and for the garbage collector.
+WORK_SHARE = 0.6
+CLOCK_EVERY = 256       # Actions applied between looks at the clock
+
+
+class TickMetrics:
+    """Timing for the most recent ticks, against the tick budget."""
+
+    def __init__(self, budget, window=1000):
+        self.budget = budget
+        self.ticks = 0
+        self.overruns = 0
+        self.actions = 0
+        self.carried = 0        # Actions left for the following tick, summed over ticks
+        self.durations = collections.deque(maxlen=window)
+
+    def record(self, duration, actions, carried=0):
+        self.ticks += 1
+        self.actions += actions
+        self.carried += carried
+        self.durations.append(duration)
+        if duration > self.budget:
+            self.overruns += 1
+
+    def percentile(self, fraction):
+        if not self.durations:
+            return 0.0
+        ordered = sorted(self.durations)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self):
+        return {'ticks': self.ticks, 'actions': self.actions, 'overruns': self.overruns,
+                'carried': self.carried, 'budget_ms': self.budget * 1e3,
+                'last_ms': self.durations[-1] * 1e3 if self.durations else 0.0,
+                'p50_ms': self.percentile(0.50) * 1e3, 'p99_ms': self.percentile(0.99) * 1e3,
+                'max_ms': max(self.durations, default=0.0) * 1e3}
+
+
+class World:
+    def __init__(self, tick_rate=10):
+        self.tick_rate = tick_rate
+        self.interval = 1.0 / tick_rate
+        self.pending = collections.deque()
+        self.fights = weakref.WeakSet()
+        self.metrics = TickMetrics(self.interval)
+        self.running = False
+
+    # -------- Queueing -------- #
+    def submit_turn(self, fight, action, item, callback):
+        """Resolve one battle turn on the next tick; callback gets its events."""
+        if not fight.turns:
+            # Once per fight: WeakSet.add makes a new weak reference each call
+            self.fights.add(fight)
+        self.pending.append((fight, action, item, callback))
+
+    def submit_quest(self, player, rng, callback):
+        """Roll a quest on the next tick; callback gets whether it succeeded."""
+        self.pending.append((None, player, rng, callback))
+
+    def queue_turn(self, fight, action, item=None):
+        return self._future(self.submit_turn, fight, action, item)
+
+    def queue_quest(self, player, rng):
+        return self._future(self.submit_quest, player, rng)
+
+    def _future(self, submit, *args):
+        future = asyncio.get_running_loop().create_future()
+
+        def resolve(result):
+            # The session may have disconnected while waiting.
+            if not future.done():
+                future.set_result(result)
+
+        submit(*args, resolve)
+        return future
+
+    @property
+    def active_battles(self):
+        return sum(1 for fight in self.fights if fight.outcome is None)
+
+    # -------- Ticking -------- #
+    def tick(self):
+        start = time.perf_counter()
+        deadline = start + self.interval * WORK_SHARE
+        pending = self.pending
+        # Only what was queued before this tick; callbacks[i] gets results[i]
+        callbacks = []
+        results = []
+        for done in range(len(pending)):
+            if done % CLOCK_EVERY == 0 and done and time.perf_counter() > deadline:
+                break
+            fight, first, second, callback = pending.popleft()
+            callbacks.append(callback)
+            if fight is None:
+                results.append(attempt_quest(first, second))
+            else:
+                results.append(fight.take_turn(first, second))
+        for callback, result in zip(callbacks, results):
+            callback(result)
+        duration = time.perf_counter() - start
+        self.metrics.record(duration, len(callbacks), len(pending))
+        METRICS.observe('mud_world_tick_seconds', duration)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.running = True
+        next_tick = loop.time()
+        while self.running:
+            self.tick()
+            next_tick += self.interval
+            delay = next_tick - loop.time()
+            if delay < 0:
+                # Behind schedule: start the next tick now rather than
+                # bunching up ticks to catch up.
+                next_tick = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    def stop(self):
+        self.running = False